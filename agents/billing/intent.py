@@ -0,0 +1,360 @@
+"""
+Tiered intent classification for free-text customer requests.
+
+Each tier runs only when the ones before it were not confident:
+
+    keywords  normalized keyword automaton over Hebrew and English text;
+              confident when exactly one intent's keywords appear, except
+              for intents in INTENT_CONFIRM_INTENTS (handlers that change
+              the account), which only a model tier can decide
+    linear    softmax regression on hashed n-grams (text_features.py);
+              confident at or above INTENT_LINEAR_THRESHOLD
+    model     the agent's transformer (inference.py), if MODEL_PATH is set;
+              confident at or above INTENT_MODEL_THRESHOLD
+
+When no tier is confident the intent is "unknown", which the agent escalates
+to the supervisor. Per-tier hit rates and latencies are kept in IntentStats.
+
+    python intent.py train intent_examples.jsonl /models/billing-intent.npz
+    python intent.py evaluate intent_examples.jsonl --linear-model /models/billing-intent.npz
+
+intent_examples.jsonl has one {"text": ..., "intent": ...} per line.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import namedtuple, deque
+
+import numpy as np
+
+from text_features import HashingEmbedder, normalize
+
+logger = logging.getLogger("Intent")
+
+UNKNOWN = "unknown"
+TIERS = ("keywords", "linear", "model")
+
+Intent = namedtuple("Intent", ["label", "confidence", "tier"])
+
+# Keyword fragments per intent. They are normalized like the input and match whole words,
+# optionally after Hebrew prefix letters (ו, ה, ב, כ, ל, מ, ש) and before a common inflection
+# suffix, so "charged", "חיובים" or "והחשבון" match but "billion" and "planet" do not.
+KEYWORDS = {
+    "billing_inquiry": [
+        "bill", "invoice", "statement", "charge", "payment due",
+        "חשבון", "חשבונית", "חיוב", "תשלום",
+    ],
+    "usage_discrepancy": [
+        "usage", "minutes", "data usage", "discrepancy", "didn't use", "did not use",
+        "overcharged", "שימוש", "דקות", "גלישה", "נפח", "חריגה", "לא השתמשתי",
+    ],
+    "refund_request": [
+        "refund", "credit", "money back", "reimburse",
+        "החזר", "זיכוי", "לזכות", "כסף בחזרה",
+    ],
+    "plan_change": [
+        "plan", "package", "upgrade", "downgrade", "switch to",
+        "מסלול", "חבילה", "שדרוג", "להחליף", "לעבור ל",
+    ],
+}
+
+HEBREW_PREFIXES = "והבכלמש"
+INFLECTION_SUFFIXES = ("s", "es", "d", "ed", "ing", "ים", "ות", "י", "ה", "ת", "ו", "נו", "ך", "כם")
+
+# A keyword hit is strong evidence but not proof; it still has to clear keyword_threshold
+KEYWORD_CONFIDENCE = 0.9
+
+
+class KeywordMatcher:
+    """One compiled alternation over every intent's keywords"""
+
+    def __init__(self, keywords):
+        self.intents = list(keywords)
+        alternatives = []
+        for index, intent in enumerate(self.intents):
+            fragments = sorted({normalize(k) for k in keywords[intent] if normalize(k)}, key=len,
+                               reverse=True)
+            if fragments:
+                joined = "|".join(re.escape(f) for f in fragments)
+                alternatives.append(f"(?P<i{index}>{joined})")
+        suffixes = "|".join(re.escape(s) for s in INFLECTION_SUFFIXES)
+        self.pattern = re.compile(
+            rf"(?<!\w)[{HEBREW_PREFIXES}]{{0,2}}(?:{'|'.join(alternatives)})(?:{suffixes})?(?!\w)"
+        ) if alternatives else None
+
+    def match(self, text):
+        """Intents whose keywords appear in `text`, in order of first appearance"""
+        if self.pattern is None:
+            return []
+        found = []
+        for match in self.pattern.finditer(normalize(text)):
+            intent = self.intents[int(match.lastgroup[1:])]
+            if intent not in found:
+                found.append(intent)
+        return found
+
+
+def softmax(logits):
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+class LinearIntentModel:
+    """Multinomial logistic regression over hashed n-gram features"""
+
+    def __init__(self, weights, bias, labels, embedder):
+        self.weights = weights
+        self.bias = bias
+        self.labels = list(labels)
+        self.embedder = embedder
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        config = json.loads(str(data["config"]))
+        embedder = HashingEmbedder(config["dim"], config["word_ngrams"], config["char_ngrams"])
+        return cls(data["weights"], data["bias"], config["labels"], embedder)
+
+    def save(self, path):
+        config = dict(self.embedder.config(), labels=self.labels)
+        np.savez(path, weights=self.weights, bias=self.bias, config=json.dumps(config))
+
+    def predict_proba(self, texts):
+        return softmax(self.embedder.transform(texts) @ self.weights + self.bias)
+
+    def predict(self, text):
+        """(label, probability) of the most likely intent"""
+        probabilities = self.predict_proba([text])[0]
+        best = int(probabilities.argmax())
+        return self.labels[best], float(probabilities[best])
+
+    @classmethod
+    def train(cls, texts, intents, dim=2048, epochs=30, learning_rate=0.5, l2=1e-4,
+              batch_size=256, seed=0):
+        """Fit with mini-batch gradient descent on cross-entropy"""
+        labels = sorted(set(intents))
+        embedder = HashingEmbedder(dim)
+        features = embedder.transform(texts)
+        targets = np.zeros((len(texts), len(labels)), dtype=np.float32)
+        targets[np.arange(len(texts)), [labels.index(intent) for intent in intents]] = 1
+        weights = np.zeros((dim, len(labels)), dtype=np.float32)
+        bias = np.zeros(len(labels), dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            order = rng.permutation(len(texts))
+            for start in range(0, len(texts), batch_size):
+                batch = order[start:start + batch_size]
+                error = softmax(features[batch] @ weights + bias) - targets[batch]
+                weights -= learning_rate * (features[batch].T @ error / len(batch) + l2 * weights)
+                bias -= learning_rate * error.mean(axis=0)
+        return cls(weights, bias, labels, embedder)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[max(1, int(np.ceil(pct / 100 * len(sorted_values)))) - 1]
+
+
+class IntentStats:
+    """Thread-safe per-tier attempt/hit counts and recent latencies"""
+
+    def __init__(self, window=2000):
+        self.lock = threading.Lock()
+        self.classified = 0
+        self.attempts = {tier: 0 for tier in TIERS}
+        self.hits = {tier: 0 for tier in TIERS}
+        self.latencies = {tier: deque(maxlen=window) for tier in TIERS}
+
+    def record(self, tier, hit, seconds):
+        with self.lock:
+            self.attempts[tier] += 1
+            self.hits[tier] += hit
+            self.latencies[tier].append(seconds)
+
+    def finish(self):
+        """Count one classification; returns the running total"""
+        with self.lock:
+            self.classified += 1
+            return self.classified
+
+    def snapshot(self):
+        """Per tier: attempts, hits, hit rate, share of all classifications and latency in ms"""
+        with self.lock:
+            result = {"classified": self.classified}
+            for tier in TIERS:
+                latencies = sorted(self.latencies[tier])
+                attempts, hits = self.attempts[tier], self.hits[tier]
+                result[tier] = {
+                    "attempts": attempts,
+                    "hits": hits,
+                    "hit_rate": round(hits / attempts, 4) if attempts else None,
+                    "share": round(hits / self.classified, 4) if self.classified else None,
+                    "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+                    "p95_ms": round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+                }
+            return result
+
+
+class IntentCascade:
+    """Keywords, then the linear model, then the transformer; stops at the first confident tier"""
+
+    def __init__(self, keywords, linear_model=None, model=None, linear_threshold=0.8,
+                 model_threshold=0.5, stats_interval=1000, keyword_threshold=0.8,
+                 confirm_intents=()):
+        self.keywords = KeywordMatcher(keywords)
+        self.intents = set(keywords)
+        self.linear_model = linear_model
+        self.model = model
+        self.keyword_threshold = keyword_threshold
+        self.confirm_intents = set(confirm_intents)
+        self.linear_threshold = linear_threshold
+        self.model_threshold = model_threshold
+        self.stats_interval = stats_interval
+        self.stats = IntentStats()
+
+    def _tiers(self):
+        yield "keywords", self._keywords
+        if self.linear_model is not None:
+            yield "linear", self._linear
+        if self.model is not None:
+            yield "model", self._model
+
+    def _keywords(self, text):
+        found = self.keywords.match(text)
+        if len(found) != 1:
+            return None, 0.0, False
+        label = found[0]
+        # Account-changing intents are never decided by keywords alone
+        confident = (
+            KEYWORD_CONFIDENCE >= self.keyword_threshold and label not in self.confirm_intents
+        )
+        return label, KEYWORD_CONFIDENCE, confident
+
+    def _linear(self, text):
+        label, confidence = self.linear_model.predict(text)
+        return label, confidence, confidence >= self.linear_threshold
+
+    def _model(self, text):
+        label, confidence = self.model.predict([text])[0]
+        return label, confidence, label in self.intents and confidence >= self.model_threshold
+
+    def classify(self, text):
+        """Intent of `text`; label is "unknown" when no tier was confident"""
+        if not text or not normalize(text):
+            return Intent(UNKNOWN, 0.0, None)
+        intent = None
+        last_tier, last_confidence = None, 0.0
+        for tier, run in self._tiers():
+            started = time.perf_counter()
+            label, confidence, confident = run(text)
+            self.stats.record(tier, confident, time.perf_counter() - started)
+            last_tier, last_confidence = tier, confidence
+            if confident:
+                intent = Intent(label, confidence, tier)
+                break
+        if intent is None:
+            intent = Intent(UNKNOWN, last_confidence, last_tier)
+
+        classified = self.stats.finish()
+        if self.stats_interval and classified % self.stats_interval == 0:
+            snapshot = self.stats.snapshot()
+            shares = ", ".join(f"{tier}={snapshot[tier]['share']}" for tier in TIERS)
+            logger.info(f"Intent tiers after {classified} requests: {shares}",
+                        extra={"intent_stats": snapshot})
+        return intent
+
+
+def load_keywords():
+    """KEYWORDS, or the JSON file at INTENT_KEYWORDS_PATH"""
+    path = os.getenv("INTENT_KEYWORDS_PATH")
+    if not path:
+        return KEYWORDS
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_intent_cascade(model=None):
+    """Cascade configured from the environment, ending in `model` if there is one"""
+    linear_path = os.getenv("INTENT_MODEL_PATH")
+    linear_model = LinearIntentModel.load(linear_path) if linear_path else None
+    if linear_model is not None:
+        logger.info(f"Loaded linear intent model from {linear_path}")
+    confirm_intents = os.getenv("INTENT_CONFIRM_INTENTS", "plan_change,refund_request")
+    return IntentCascade(
+        load_keywords(),
+        linear_model=linear_model,
+        model=model,
+        keyword_threshold=float(os.getenv("INTENT_KEYWORD_THRESHOLD", "0.8")),
+        confirm_intents=[intent.strip() for intent in confirm_intents.split(",") if intent.strip()],
+        linear_threshold=float(os.getenv("INTENT_LINEAR_THRESHOLD", "0.8")),
+        model_threshold=float(os.getenv("INTENT_MODEL_THRESHOLD", "0.5")),
+        stats_interval=int(os.getenv("INTENT_STATS_INTERVAL", "1000")),
+    )
+
+
+def load_examples(path):
+    texts, intents = [], []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                example = json.loads(line)
+                texts.append(example["text"])
+                intents.append(example["intent"])
+    return texts, intents
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Train or evaluate the intent cascade")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train", help="fit the linear tier")
+    train.add_argument("examples")
+    train.add_argument("output", help="path of the .npz model")
+    train.add_argument("--dim", type=int, default=2048)
+    train.add_argument("--epochs", type=int, default=30)
+    evaluate = subparsers.add_parser("evaluate", help="per-tier hit rate, accuracy and latency")
+    evaluate.add_argument("examples")
+    evaluate.add_argument("--linear-model", default=os.getenv("INTENT_MODEL_PATH"))
+    args = parser.parse_args()
+
+    texts, intents = load_examples(args.examples)
+    if args.command == "train":
+        model = LinearIntentModel.train(texts, intents, dim=args.dim, epochs=args.epochs)
+        model.save(args.output)
+        logger.info(f"Trained on {len(texts)} examples, labels {model.labels}")
+        return 0
+
+    linear_model = LinearIntentModel.load(args.linear_model) if args.linear_model else None
+    cascade = IntentCascade(load_keywords(), linear_model=linear_model, stats_interval=0)
+    correct = {tier: 0 for tier in TIERS}
+    for text, expected in zip(texts, intents):
+        intent = cascade.classify(text)
+        if intent.label == expected and intent.tier:
+            correct[intent.tier] += 1
+    snapshot = cascade.stats.snapshot()
+
+    def ms(value):
+        return f"{value:.3f}ms" if value is not None else "-"
+
+    for tier in TIERS:
+        tier_stats = snapshot[tier]
+        accuracy = correct[tier] / tier_stats["hits"] if tier_stats["hits"] else None
+        print(f"{tier:<10} attempts={tier_stats['attempts']:<7} hits={tier_stats['hits']:<7} "
+              f"share={tier_stats['share']} accuracy={accuracy} "
+              f"p50={ms(tier_stats['p50_ms'])} p95={ms(tier_stats['p95_ms'])}")
+    unresolved = len(texts) - sum(snapshot[tier]["hits"] for tier in TIERS)
+    print(f"unresolved={unresolved} of {len(texts)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
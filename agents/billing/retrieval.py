@@ -0,0 +1,217 @@
+"""
+Knowledge-base retrieval for billing inquiries.
+
+Policy and FAQ answers are embedded once, offline, into an index directory:
+
+    embeddings.npy   float32 (rows, dim), unit-length rows, memory-mapped at load
+    rows.npy         int32 answer index for each row (an answer may have several questions)
+    answers.json     the answers, in answer-index order
+    idf.npy          IDF weights of the hashing embedder
+    meta.json        embedder settings and IVF layout
+    centroids.npy    IVF only: (nlist, dim) cluster centroids
+    offsets.npy      IVF only: rows of list i are embeddings[offsets[i]:offsets[i + 1]]
+
+Search is cosine similarity: a batched dot product over the whole matrix, or
+over the `nprobe` IVF lists nearest to the query once the index is large
+enough to be built with lists. For IVF, rows are stored grouped by list, so
+probing a list is a contiguous slice of the memory map.
+
+    python retrieval.py build knowledge_base.jsonl /models/billing-kb --nlist 64
+
+knowledge_base.jsonl has one answer per line:
+{"id": "...", "questions": ["...", ...], "answer": "...", "category": "..."}
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from text_features import HashingEmbedder, normalize
+
+logger = logging.getLogger("BillingAgent.Retrieval")
+
+Match = namedtuple("Match", ["answer", "score"])
+
+# Rows scored per matrix multiply when scanning the whole index
+SCAN_CHUNK_ROWS = 65536
+
+
+class KnowledgeBase:
+    """Memory-mapped embedding index over knowledge-base answers"""
+
+    def __init__(self, path, min_score=0.75, nprobe=8):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "answers.json")) as f:
+            self.answers = json.load(f)
+        self.embedder = HashingEmbedder(
+            meta["dim"], meta["word_ngrams"], meta["char_ngrams"],
+            idf=np.load(os.path.join(path, "idf.npy"))
+        )
+        # Pages of the matrix are shared between processes and loaded on first touch
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(path, "rows.npy"))
+        self.centroids = None
+        self.offsets = None
+        if meta.get("nlist"):
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+            self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.min_score = min_score
+        self.nprobe = nprobe
+        self.lookup = lru_cache(maxsize=4096)(self._lookup)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def _scan(self, queries, start, end):
+        """Best (score, row) per query within rows [start, end)"""
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        best_rows = np.zeros(len(queries), dtype=np.int64)
+        for chunk_start in range(start, end, SCAN_CHUNK_ROWS):
+            chunk_end = min(chunk_start + SCAN_CHUNK_ROWS, end)
+            scores = queries @ self.embeddings[chunk_start:chunk_end].T
+            rows = scores.argmax(axis=1)
+            chunk_best = scores[np.arange(len(queries)), rows]
+            better = chunk_best > best_scores
+            best_scores[better] = chunk_best[better]
+            best_rows[better] = rows[better] + chunk_start
+        return best_scores, best_rows
+
+    def search(self, queries):
+        """Best (score, row) per row of `queries`, by brute force or over the nearest IVF lists"""
+        if self.centroids is None:
+            return self._scan(queries, 0, len(self.embeddings))
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        best_rows = np.zeros(len(queries), dtype=np.int64)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        for i, lists in enumerate(probes):
+            for list_id in lists:
+                start, end = self.offsets[list_id], self.offsets[list_id + 1]
+                if start == end:
+                    continue
+                scores, rows = self._scan(queries[i:i + 1], start, end)
+                if scores[0] > best_scores[i]:
+                    best_scores[i], best_rows[i] = scores[0], rows[0]
+        return best_scores, best_rows
+
+    def match_many(self, texts):
+        """Best answer and its cosine score for each text (no threshold)"""
+        scores, rows = self.search(self.embedder.transform(texts))
+        return [
+            Match(self.answers[self.rows[row]], float(score)) for score, row in zip(scores, rows)
+        ]
+
+    def _lookup(self, normalized_text):
+        match = self.match_many([normalized_text])[0]
+        return match if match.score >= self.min_score else None
+
+    def answer(self, text):
+        """Cached answer for `text` if the best match clears the confidence threshold"""
+        return self.lookup(normalize(text))
+
+
+def load_knowledge_base():
+    """KnowledgeBase from KB_INDEX_PATH, or None when no index is configured"""
+    path = os.getenv("KB_INDEX_PATH")
+    if not path:
+        return None
+    knowledge_base = KnowledgeBase(
+        path,
+        min_score=float(os.getenv("KB_MIN_SCORE", "0.75")),
+        nprobe=int(os.getenv("KB_NPROBE", "8")),
+    )
+    logger.info(f"Loaded knowledge base with {len(knowledge_base)} entries from {path}")
+    return knowledge_base
+
+
+def spherical_kmeans(vectors, k, iterations=20, seed=0):
+    """Unit-length centroids and the cluster of each vector"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = (vectors @ centroids.T).argmax(axis=1)
+        for cluster in range(k):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[cluster] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids, (vectors @ centroids.T).argmax(axis=1)
+
+
+def build_index(source, path, dim=1024, nlist=0):
+    """Embed every question in the JSON-lines knowledge base into an index directory"""
+    answers, questions, rows = [], [], []
+    with open(source) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            entry_questions = entry.pop("questions", None) or [entry.pop("question")]
+            for question in entry_questions:
+                questions.append(question)
+                rows.append(len(answers))
+            answers.append(entry)
+
+    embedder = HashingEmbedder(dim).fit_idf(questions)
+    embeddings = embedder.transform(questions)
+    rows = np.array(rows, dtype=np.int32)
+
+    os.makedirs(path, exist_ok=True)
+    meta = dict(embedder.config(), nlist=0)
+    nlist = min(nlist, len(questions))
+    if nlist > 1:
+        centroids, assignments = spherical_kmeans(embeddings, nlist)
+        # Group rows by list so each list is one contiguous slice of the matrix
+        order = np.argsort(assignments, kind="stable")
+        embeddings, rows = embeddings[order], rows[order]
+        offsets = np.searchsorted(assignments[order], np.arange(nlist + 1))
+        np.save(os.path.join(path, "centroids.npy"), centroids.astype(np.float32))
+        np.save(os.path.join(path, "offsets.npy"), offsets.astype(np.int64))
+        meta["nlist"] = nlist
+
+    np.save(os.path.join(path, "embeddings.npy"), embeddings)
+    np.save(os.path.join(path, "rows.npy"), rows)
+    np.save(os.path.join(path, "idf.npy"), embedder.idf)
+    with open(os.path.join(path, "answers.json"), "w") as f:
+        json.dump(answers, f, ensure_ascii=False)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    logger.info(
+        f"Built {path}: {len(answers)} answers, {len(questions)} questions, "
+        f"dim={dim}, nlist={meta['nlist']}"
+    )
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Build or query the billing knowledge base index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="embed a JSON-lines knowledge base")
+    build.add_argument("source")
+    build.add_argument("path")
+    build.add_argument("--dim", type=int, default=1024)
+    build.add_argument("--nlist", type=int, default=0, help="IVF lists (0 for brute force)")
+    query = subparsers.add_parser("query", help="show the best match for a question")
+    query.add_argument("path")
+    query.add_argument("text")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index(args.source, args.path, args.dim, args.nlist)
+    else:
+        match = KnowledgeBase(args.path).match_many([args.text])[0]
+        print(json.dumps({"score": match.score, "answer": match.answer}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Non-blocking structured logging with batched shipping to Elasticsearch.
+
+Callers only build a LogRecord and put it on an in-memory queue; formatting,
+stdout output and Elasticsearch `_bulk` requests all happen on a background
+listener thread. Both the queue and the shipping buffer are bounded: when
+Elasticsearch is slow or down, records are dropped and counted rather than
+blocking the code that logs. The counts are logged as warnings once there is
+room again, and documents Elasticsearch rejects are retried or reported.
+
+    from structured_logging import setup_logging, shutdown_logging
+    setup_logging("api")
+    ...
+    shutdown_logging()
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import time
+import threading
+import urllib.request
+from collections import deque
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "taskName"
+}
+
+
+def parse_sample_rates(spec):
+    """Parse "DEBUG=0.01,INFO=0.5" into {logging.DEBUG: 0.01, logging.INFO: 0.5}"""
+    rates = {}
+    for pair in spec.split(","):
+        if "=" in pair:
+            level, rate = pair.split("=", 1)
+            rates[logging.getLevelName(level.strip().upper())] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a configurable fraction of records per level; WARNING and above are always kept"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {level: rate for level, rate in rates.items() if level < logging.WARNING}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        return rate is None or rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON document per record, including any `extra=` fields"""
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def to_document(self, record):
+        document = {
+            "@timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "service": self.service,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and not key.startswith("_"):
+                document[key] = value
+        return document
+
+    def format(self, record):
+        return json.dumps(self.to_document(record), default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks: a full queue drops the record and counts it.
+    The count is logged with the next record that fits, at most once per
+    `report_interval` seconds.
+    """
+
+    def __init__(self, log_queue, report_interval=10.0):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.dropped_total = 0
+        self.report_interval = report_interval
+        self._last_report = 0.0
+        self._drop_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Only merge args here; formatting happens on the listener thread
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+                self.dropped_total += 1
+            return
+        if self.dropped and time.monotonic() - self._last_report >= self.report_interval:
+            self._report_dropped()
+
+    def _report_dropped(self):
+        with self._drop_lock:
+            dropped, self.dropped = self.dropped, 0
+            self._last_report = time.monotonic()
+        if not dropped:
+            return
+        try:
+            self.queue.put_nowait(logging.makeLogRecord({
+                "name": "structured_logging", "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"Dropped {dropped} log records: logging queue full",
+            }))
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += dropped
+
+
+class ElasticsearchBulkHandler(logging.Handler):
+    """
+    Buffers formatted documents and ships them to Elasticsearch with `_bulk`
+    requests from its own thread, once `batch_size` documents are waiting or
+    `flush_interval` seconds have passed.
+
+    The buffer holds at most `buffer_size` documents. While Elasticsearch is
+    unreachable the flusher backs off exponentially and new documents beyond
+    that bound are dropped, so a logging outage never grows memory without limit.
+    """
+
+    def __init__(self, url, service, index_prefix="pelephone-logs", batch_size=500,
+                 flush_interval=2.0, buffer_size=20000, timeout=5.0):
+        super().__init__()
+        self.bulk_url = f"{url.rstrip('/')}/_bulk"
+        self.index_prefix = f"{index_prefix}-{service}"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.formatter = JsonFormatter(service)
+        self.buffer = deque()
+        self.buffer_size = buffer_size
+        self.dropped = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="es-log-shipper", daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        if len(self.buffer) >= self.buffer_size:
+            self.dropped += 1
+            return
+        self.buffer.append(self.formatter.to_document(record))
+        if len(self.buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _bulk_body(self, documents):
+        lines = []
+        for document in documents:
+            index = f"{self.index_prefix}-{document['@timestamp'][:10].replace('-', '.')}"
+            lines.append(json.dumps({"index": {"_index": index}}))
+            lines.append(json.dumps(document, default=str))
+        return ("\n".join(lines) + "\n").encode()
+
+    def _ship(self, documents):
+        """Send one `_bulk` request; returns the documents worth retrying.
+
+        Items rejected with 429 or a 5xx status are returned for a retry. Other
+        rejections (e.g. mapping errors) would fail again, so they are reported
+        and dropped.
+        """
+        request = urllib.request.Request(
+            self.bulk_url,
+            data=self._bulk_body(documents),
+            headers={"Content-Type": "application/x-ndjson"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.loads(response.read())
+        if not result.get("errors"):
+            return []
+        retry, rejected, error = [], 0, None
+        for document, item in zip(documents, result.get("items", [])):
+            outcome = item.get("index", {})
+            status = outcome.get("status", 200)
+            if status < 300:
+                continue
+            if status == 429 or status >= 500:
+                retry.append(document)
+            else:
+                rejected += 1
+                error = outcome.get("error")
+        if rejected:
+            sys.stderr.write(
+                f"Elasticsearch rejected {rejected} log documents, last error: {error}\n"
+            )
+        return retry
+
+    def flush(self):
+        """Ship everything currently buffered; returns False if Elasticsearch refused it"""
+        while self.buffer:
+            batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+            if self.dropped:
+                batch.append(self.formatter.to_document(logging.makeLogRecord({
+                    "name": "structured_logging", "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Dropped {self.dropped} log records under backpressure",
+                })))
+                self.dropped = 0
+            try:
+                retry = self._ship(batch)
+            except Exception as e:
+                self._requeue(batch)
+                sys.stderr.write(f"Elasticsearch log shipping failed: {e}\n")
+                return False
+            if retry:
+                # Elasticsearch is overloaded; back off before sending these again
+                self._requeue(retry)
+                return False
+        return True
+
+    def _requeue(self, batch):
+        """Put a batch back (oldest first) as far as there is room; count the rest as dropped"""
+        room = max(0, self.buffer_size - len(self.buffer))
+        for document in reversed(batch[:room]):
+            self.buffer.appendleft(document)
+        self.dropped += len(batch) - min(room, len(batch))
+
+    def _run(self):
+        backoff = self.flush_interval
+        while not self._stopping.is_set():
+            self._wakeup.wait(backoff)
+            self._wakeup.clear()
+            if self.flush():
+                backoff = self.flush_interval
+            else:
+                backoff = min(backoff * 2, 60)
+
+    def close(self):
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout=self.timeout)
+        self.flush()
+        super().close()
+
+
+# The running listener and its handlers, by process (a forked child starts afresh)
+_active = {"pid": None, "listener": None, "handlers": []}
+_lock = threading.Lock()
+
+
+def setup_logging(service, level=None):
+    """Route all logging through a bounded queue to stdout and, if configured, Elasticsearch.
+
+    Idempotent within a process: later calls return the running listener.
+    """
+    with _lock:
+        if _active["pid"] == os.getpid() and _active["listener"] is not None:
+            return _active["listener"]
+        return _start_logging(service, level)
+
+
+def _start_logging(service, level):
+    level = (level or os.getenv("LOG_LEVEL", "info")).upper()
+    log_format = os.getenv("LOG_FORMAT", "text")
+    sample_rates = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+    elasticsearch_url = os.getenv("ELASTICSEARCH_URL")
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if log_format == "json":
+        stream_handler.setFormatter(JsonFormatter(service))
+    else:
+        stream_handler.setFormatter(
+            logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        )
+    handlers = [stream_handler]
+    if elasticsearch_url:
+        handlers.append(ElasticsearchBulkHandler(
+            elasticsearch_url,
+            service,
+            index_prefix=os.getenv("LOG_INDEX_PREFIX", "pelephone-logs"),
+            batch_size=int(os.getenv("LOG_BULK_SIZE", "500")),
+            flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "2")),
+            buffer_size=int(os.getenv("LOG_BUFFER_SIZE", "20000")),
+        ))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    if _active["pid"] is None:
+        atexit.register(shutdown_logging)
+    _active.update(pid=os.getpid(), listener=listener, handlers=handlers)
+    return listener
+
+
+def shutdown_logging():
+    """Drain the queue, flush Elasticsearch and stop the listener; safe to call twice"""
+    with _lock:
+        if _active["pid"] != os.getpid() or _active["listener"] is None:
+            return
+        listener, handlers = _active["listener"], _active["handlers"]
+        _active.update(listener=None, handlers=[])
+    listener.stop()
+    for handler in handlers:
+        handler.close()
@@ -1,19 +1,27 @@
 import os
 import json
 import logging
+import functools
+import threading
 import pika
 import redis
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from structured_logging import setup_logging
+from tracing import tracer_from_env
+from sharding import ShardMembership, ShardedConsumer, declare_shards, shard_count
+from profiling import ProfileControl
+from keyspace import keyspace_from_env, tagged_key
+from inference import load_backend
+from intent import load_intent_cascade
+
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging("international-agent")
 logger = logging.getLogger("BillingAgent")
 
 class BillingAgent:
@@ -26,6 +34,19 @@ class BillingAgent:
     """
     
     def __init__(self):
+        self.connection = None
+        self.channel = None
+        # Handlers run on worker threads so the connection thread keeps servicing heartbeats
+        self.handler_workers = int(os.getenv("HANDLER_WORKERS", "1"))
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.handler_workers,
+            thread_name_prefix="international-handler"
+        )
+        self._io_thread_id = None
+        # Customer-sharded request queues: handlers run on one thread per owned shard
+        self.queue_shards = shard_count()
+        self.sharded_consumer = None
+        self.tracer = tracer_from_env("international-agent")
         self.connect_to_redis()
         self.connect_to_rabbitmq()
         self.load_model()
@@ -34,6 +55,8 @@ class BillingAgent:
         """Connect to Redis for session management and caching"""
         redis_url = os.getenv("REDIS_URL", "redis://:password@redis:6379/0")
         self.redis_client = redis.from_url(redis_url)
+        # Customer and plan caches are sharded over REDIS_SHARD_URLS when it is set
+        self.keyspace = keyspace_from_env(redis_url, self.redis_client)
         logger.info("Connected to Redis")
         
     def connect_to_rabbitmq(self):
@@ -45,20 +68,43 @@ class BillingAgent:
         for attempt in range(max_retries):
             try:
                 parameters = pika.URLParameters(rabbitmq_url)
+                parameters.heartbeat = int(os.getenv("RABBITMQ_HEARTBEAT", "30"))
                 self.connection = pika.BlockingConnection(parameters)
                 self.channel = self.connection.channel()
                 
                 # Declare queues
-                self.channel.queue_declare(queue='billing_requests', durable=True)
-                self.channel.queue_declare(queue='billing_responses', durable=True)
+                self.channel.queue_declare(queue='international_responses', durable=True)
                 self.channel.queue_declare(queue='supervisor_notifications', durable=True)
                 
                 # Set up consumer
-                self.channel.basic_consume(
-                    queue='billing_requests',
-                    on_message_callback=self.process_request,
-                    auto_ack=False
-                )
+                if self.queue_shards:
+                    declare_shards(self.channel, 'international_requests', self.queue_shards)
+                    self.sharded_consumer = ShardedConsumer(
+                        self.connection,
+                        self.channel,
+                        'international_requests',
+                        self.queue_shards,
+                        self.process_request,
+                        membership=self.shard_membership(),
+                        prefetch=int(os.getenv("SHARD_PREFETCH", "2")),
+                        rebalance_interval=float(os.getenv("SHARD_REBALANCE_INTERVAL", "5")),
+                        thread_name_prefix="international-shard",
+                        # Shards share HANDLER_WORKERS, which inference threads are sized for
+                        concurrency=self.handler_workers
+                    )
+                    self.sharded_consumer.start()
+                else:
+                    # Never hold more unacked messages than there are free handler threads
+                    self.channel.basic_qos(prefetch_count=self.handler_workers)
+                    self.channel.queue_declare(queue='international_requests', durable=True)
+                    self.channel.basic_consume(
+                        queue='international_requests',
+                        on_message_callback=self.process_request,
+                        auto_ack=False
+                    )
+                
+                # Signed profile requests from the agent_control exchange (off without a key)
+                ProfileControl(self.connection, self.channel, "international-agent").start()
                 
                 logger.info("Connected to RabbitMQ")
                 break
@@ -70,64 +116,170 @@ class BillingAgent:
                     logger.error("Failed to connect to RabbitMQ after multiple attempts")
                     raise
     
+    def shard_membership(self):
+        """Redis membership used to split the request shards between replicas"""
+        if self.redis_client is None:
+            return None
+        return ShardMembership(
+            self.redis_client,
+            'international_requests',
+            self.queue_shards,
+            lease_seconds=int(os.getenv("SHARD_LEASE_SECONDS", "15"))
+        )
+    
     def load_model(self):
         """Load the AI model for billing queries"""
-        logger.info("Loading billing model...")
-        # In a real implementation, we would load the model here
-        # For example:
-        # from transformers import AutoTokenizer, AutoModelForSequenceClassification
-        # self.tokenizer = AutoTokenizer.from_pretrained("path/to/tokenizer")
-        # self.model = AutoModelForSequenceClassification.from_pretrained("path/to/model")
-        logger.info("Billing model loaded successfully")
+        model_path = os.getenv("MODEL_PATH")
+        if model_path:
+            backend = os.getenv("INFERENCE_BACKEND", "eager")
+            logger.info(f"Loading billing model ({backend} backend)...")
+            self.model = load_backend(backend, model_path, handler_workers=self.handler_workers)
+            logger.info("Billing model loaded successfully")
+        else:
+            logger.info("MODEL_PATH not set; running without a billing model")
+            self.model = None
+        # The model is only the last tier for requests submitted without a type
+        self.intent_classifier = load_intent_cascade(self.model)
     
     def process_request(self, ch, method, properties, body):
-        """Process incoming billing requests"""
+        """Hand an incoming billing request to the handler pool.
+
+        This runs on the connection thread and must return quickly. The response
+        is published and the message acknowledged back on the connection thread
+        once the handler has finished.
+        """
+        # The consume span continues the publisher's trace and ends at ack/nack
+        received_at = time.time()
+        span = self.tracer.start_span(
+            f"consume {method.routing_key}",
+            headers=properties.headers,
+            kind="CONSUMER",
+            start=received_at,
+            attributes={"messaging.redelivered": method.redelivered}
+        )
+        self.tracer.record_queue_wait(span, properties.headers, received_at)
+        self.executor_for(method).submit(self._run_handler, ch, method, properties, body, span)
+    
+    def executor_for(self, method):
+        """Sharded deliveries run in order on their shard's thread, others on the shared pool"""
+        if self.sharded_consumer is not None:
+            return self.sharded_consumer.executor(method.consumer_tag)
+        return self.executor
+    
+    def _run_handler(self, ch, method, properties, body, span):
+        """Run the request handler on a worker thread"""
+        try:
+            with self.tracer.activate(span), self.tracer.span("handle request") as handler_span:
+                request = json.loads(body)
+                handler_span.name = f"handle {request.get('type', 'unknown')}"
+                handler_span.set_attribute("request_id", request.get('request_id'))
+                logger.info(f"Received billing request: {request.get('request_id')}")
+                response = self.dispatch_request(request)
+                if 'intent' in request:
+                    response.setdefault('intent', request['intent'])
+        except Exception as e:
+            logger.error(f"Error processing request: {str(e)}")
+            self.run_on_connection_thread(functools.partial(
+                self._reject_request, ch, method.delivery_tag, body, str(e), span
+            ))
+            return
+        
+        self.run_on_connection_thread(functools.partial(
+            self._complete_request, ch, method.delivery_tag, properties, request, response, span
+        ))
+    
+    def dispatch_request(self, request):
+        """Route a decoded request to its handler and return the response"""
+        request_type = request.get('type', 'unknown')
+        if request_type == 'auto':
+            request_type = self.classify_request(request)
+        
+        if request_type == 'billing_inquiry':
+            return self.handle_billing_inquiry(request)
+        elif request_type == 'usage_discrepancy':
+            return self.handle_usage_discrepancy(request)
+        elif request_type == 'refund_request':
+            return self.handle_refund_request(request)
+        elif request_type == 'plan_change':
+            return self.handle_plan_change(request)
+        
+        logger.warning(f"Unknown request type: {request_type}")
+        
+        # Notify supervisor about unknown request type
+        self.notify_supervisor(request, error="Unknown request type")
+        return {
+            'status': 'error',
+            'message': f"Unknown request type: {request_type}",
+            'request_id': request.get('request_id')
+        }
+    
+    def classify_request(self, request):
+        """Resolve the type of a request submitted as "auto" from its free text"""
+        details = request.get('details') or {}
+        text = details.get('inquiry') or details.get('message') or details.get('text') or ''
+        intent = self.intent_classifier.classify(text)
+        request['type'] = intent.label
+        request['intent'] = {'tier': intent.tier, 'confidence': round(intent.confidence, 3)}
+        span = self.tracer.current_span()
+        if span is not None:
+            span.set_attribute("intent", intent.label)
+            span.set_attribute("intent.tier", intent.tier)
+        logger.info(f"Classified request {request.get('request_id')} as {intent.label} "
+                    f"({intent.tier}, {intent.confidence:.2f})")
+        return intent.label
+    
+    def _complete_request(self, ch, delivery_tag, properties, request, response, span):
+        """Publish the response and acknowledge the request (connection thread only)"""
         try:
-            request = json.loads(body)
-            logger.info(f"Received billing request: {request.get('request_id')}")
-            
-            # Process the request based on type
-            request_type = request.get('type', 'unknown')
-            
-            if request_type == 'billing_inquiry':
-                response = self.handle_billing_inquiry(request)
-            elif request_type == 'usage_discrepancy':
-                response = self.handle_usage_discrepancy(request)
-            elif request_type == 'refund_request':
-                response = self.handle_refund_request(request)
-            elif request_type == 'plan_change':
-                response = self.handle_plan_change(request)
-            else:
-                logger.warning(f"Unknown request type: {request_type}")
-                response = {
-                    'status': 'error',
-                    'message': f"Unknown request type: {request_type}",
-                    'request_id': request.get('request_id')
-                }
-                
-                # Notify supervisor about unknown request type
-                self.notify_supervisor(request, error="Unknown request type")
-            
             # Send response back
-            self.channel.basic_publish(
-                exchange='',
-                routing_key='billing_responses',
-                body=json.dumps(response),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # make message persistent
-                    correlation_id=properties.correlation_id,
-                    reply_to=properties.reply_to
+            with self.tracer.span(
+                "publish international_responses", parent=span, kind="PRODUCER"
+            ) as publish_span:
+                self.channel.basic_publish(
+                    exchange='',
+                    routing_key='international_responses',
+                    body=json.dumps(response),
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,  # make message persistent
+                        correlation_id=properties.correlation_id,
+                        reply_to=properties.reply_to,
+                        headers=self.tracer.inject(span=publish_span)
+                    )
                 )
-            )
             
             # Acknowledge the message
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            ch.basic_ack(delivery_tag=delivery_tag)
             logger.info(f"Processed request {request.get('request_id')}")
-            
         except Exception as e:
-            logger.error(f"Error processing request: {str(e)}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-            self.notify_supervisor({"error": str(e), "body": body.decode()}, error="Processing error")
+            logger.error(f"Error sending response: {str(e)}")
+            self._reject_request(ch, delivery_tag, json.dumps(request).encode(), str(e), span)
+            return
+        span.finish()
+    
+    def _reject_request(self, ch, delivery_tag, body, error, span):
+        """Drop a request that could not be processed (connection thread only)"""
+        try:
+            ch.basic_nack(delivery_tag=delivery_tag, requeue=False)
+        except Exception as e:
+            logger.error(f"Failed to reject request: {str(e)}")
+        with self.tracer.activate(span):
+            self.notify_supervisor({"error": error, "body": body.decode()}, error="Processing error")
+        span.finish(error=error)
+    
+    def run_on_connection_thread(self, callback):
+        """Run a callback on the thread that owns the RabbitMQ connection.
+
+        pika connections are not thread-safe, so worker threads must never touch
+        the channel directly.
+        """
+        if self.connection is None or threading.get_ident() == self._io_thread_id:
+            callback()
+            return
+        try:
+            self.connection.add_callback_threadsafe(callback)
+        except Exception as e:
+            # The broker will redeliver anything we failed to ack
+            logger.error(f"Connection closed before callback could run: {str(e)}")
     
     def handle_billing_inquiry(self, request):
         """Handle general billing inquiries"""
@@ -242,22 +394,30 @@ class BillingAgent:
             'escalation': escalation
         }
         
-        self.channel.basic_publish(
-            exchange='',
-            routing_key='supervisor_notifications',
-            body=json.dumps(notification),
-            properties=pika.BasicProperties(
-                delivery_mode=2  # make message persistent
+        body = json.dumps(notification)
+        # Captured here: the publish itself runs on the connection thread
+        headers = self.tracer.inject()
+        
+        def publish():
+            self.channel.basic_publish(
+                exchange='',
+                routing_key='supervisor_notifications',
+                body=body,
+                properties=pika.BasicProperties(
+                    delivery_mode=2,  # make message persistent
+                    headers=headers
+                )
             )
-        )
-        logger.info("Supervisor notified")
+            logger.info("Supervisor notified")
+        
+        self.run_on_connection_thread(publish)
     
     def get_customer_info(self, customer_id):
         """Get customer information from cache or database"""
         # Try to get from cache first
-        cached_info = self.redis_client.get(f"customer:{customer_id}")
+        cached_info = self.keyspace.get(tagged_key("customer", customer_id))
         if cached_info:
-            return json.loads(cached_info)
+            return cached_info
         
         # If not in cache, this would normally fetch from the database
         # For this example, we'll return mock data
@@ -272,10 +432,10 @@ class BillingAgent:
         }
         
         # Store in cache for future use
-        self.redis_client.setex(
-            f"customer:{customer_id}",
-            3600,  # 1 hour expiration
-            json.dumps(customer_info)
+        self.keyspace.set(
+            tagged_key("customer", customer_id),
+            customer_info,
+            ex=3600  # 1 hour expiration
         )
         
         return customer_info
@@ -283,9 +443,9 @@ class BillingAgent:
     def get_available_plans(self):
         """Get list of available plans"""
         # Try to get from cache
-        cached_plans = self.redis_client.get("available_plans")
+        cached_plans = self.keyspace.get("available_plans")
         if cached_plans:
-            return json.loads(cached_plans)
+            return cached_plans
         
         # Mock data for available plans
         plans = [
@@ -298,10 +458,10 @@ class BillingAgent:
         ]
         
         # Store in cache
-        self.redis_client.setex(
+        self.keyspace.set(
             "available_plans",
-            86400,  # 24 hour expiration
-            json.dumps(plans)
+            plans,
+            ex=86400  # 24 hour expiration
         )
         
         return plans
@@ -309,12 +469,23 @@ class BillingAgent:
     def run(self):
         """Start consuming messages"""
         logger.info("Billing Agent is running. Waiting for messages...")
+        self._io_thread_id = threading.get_ident()
         try:
             self.channel.start_consuming()
         except KeyboardInterrupt:
             self.channel.stop_consuming()
-            self.connection.close()
+            self.shutdown()
             logger.info("Billing Agent stopped")
+    
+    def shutdown(self):
+        """Let in-flight handlers finish, flush their acks and close the connection"""
+        if self.sharded_consumer is not None:
+            self.sharded_consumer.stop()
+        self.executor.shutdown(wait=True)
+        if self.connection is not None and self.connection.is_open:
+            # Run the publish/ack callbacks queued by the handlers before closing
+            self.connection.process_data_events(time_limit=0)
+            self.connection.close()
 
 if __name__ == "__main__":
     # Wait for a short period to ensure RabbitMQ is ready
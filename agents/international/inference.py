@@ -0,0 +1,225 @@
+"""
+CPU inference backends for the agent's sequence-classification model.
+
+    eager       PyTorch in float32, as trained
+    torch-int8  PyTorch with dynamic int8 quantization of the Linear layers
+    onnx        ONNX Runtime on an exported graph (model.onnx)
+    onnx-int8   ONNX Runtime on a dynamically quantized graph (model.int8.onnx)
+
+All backends take a Hugging Face model directory (MODEL_PATH) and expose the
+same `predict_proba(texts)`. The ONNX graphs are built once, offline:
+
+    python inference.py export /models/billing --quantize
+
+Handlers run inference concurrently on HANDLER_WORKERS threads, so each call
+gets an equal share of the CPUs instead of every call trying to use all of them.
+Compare backends on real traffic with benchmarks/bench_inference.py.
+"""
+import os
+import sys
+import logging
+import argparse
+
+import numpy as np
+
+logger = logging.getLogger("Inference")
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+MAX_LENGTH = int(os.getenv("INFERENCE_MAX_LENGTH", "128"))
+
+
+def available_cpus():
+    """CPUs this process may use, honouring affinity and a cgroup v2 CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) // int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def threads_per_call(handler_workers):
+    """Intra-op threads for one inference call (INFERENCE_THREADS overrides)"""
+    configured = int(os.getenv("INFERENCE_THREADS", "0"))
+    if configured > 0:
+        return configured
+    return max(1, available_cpus() // max(1, handler_workers))
+
+
+def softmax(logits):
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+class InferenceBackend:
+    """Tokenizer plus model; subclasses implement `_logits`"""
+
+    name = None
+
+    def __init__(self, model_path, threads):
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.model_path = model_path
+        self.threads = threads
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        config = AutoConfig.from_pretrained(model_path)
+        self.labels = [config.id2label[i] for i in range(config.num_labels)]
+
+    def _logits(self, encoded):
+        raise NotImplementedError
+
+    def predict_proba(self, texts):
+        """Class probabilities, one row per text"""
+        encoded = self.tokenizer(
+            list(texts), padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="np"
+        )
+        return softmax(self._logits(encoded))
+
+    def predict(self, texts):
+        """(label, confidence) per text"""
+        probabilities = self.predict_proba(texts)
+        best = probabilities.argmax(axis=-1)
+        return [(self.labels[i], float(row[i])) for i, row in zip(best, probabilities)]
+
+
+class EagerBackend(InferenceBackend):
+    name = "eager"
+
+    def __init__(self, model_path, threads):
+        super().__init__(model_path, threads)
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        self.torch = torch
+        # Process-wide: every handler thread shares this setting
+        torch.set_num_threads(threads)
+        self.model = self._prepare(AutoModelForSequenceClassification.from_pretrained(model_path))
+        self.model.eval()
+
+    def _prepare(self, model):
+        return model
+
+    def _logits(self, encoded):
+        inputs = {key: self.torch.from_numpy(value) for key, value in encoded.items()}
+        with self.torch.inference_mode():
+            return self.model(**inputs).logits.numpy()
+
+
+class TorchInt8Backend(EagerBackend):
+    name = "torch-int8"
+
+    def _prepare(self, model):
+        return self.torch.quantization.quantize_dynamic(
+            model, {self.torch.nn.Linear}, dtype=self.torch.qint8
+        )
+
+
+class OnnxBackend(InferenceBackend):
+    name = "onnx"
+    onnx_file = ONNX_FILE
+
+    def __init__(self, model_path, threads):
+        super().__init__(model_path, threads)
+        import onnxruntime as ort
+
+        path = os.path.join(model_path, self.onnx_file)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"{path} not found; build it with: python inference.py export {model_path}"
+                + (" --quantize" if self.onnx_file == ONNX_INT8_FILE else "")
+            )
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _logits(self, encoded):
+        inputs = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(None, inputs)[0]
+
+
+class OnnxInt8Backend(OnnxBackend):
+    name = "onnx-int8"
+    onnx_file = ONNX_INT8_FILE
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (EagerBackend, TorchInt8Backend, OnnxBackend, OnnxInt8Backend)
+}
+
+
+def load_backend(name, model_path, handler_workers=1):
+    """Instantiate a backend by name, sizing its threads for the handler pool"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}; choose from {sorted(BACKENDS)}")
+    threads = threads_per_call(handler_workers)
+    logger.info(f"Loading {name} backend from {model_path} ({threads} threads per call)")
+    return BACKENDS[name](model_path, threads)
+
+
+def export_onnx(model_path, quantize=False, opset=14):
+    """Export the model directory to model.onnx and optionally model.int8.onnx"""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path)
+    model.eval()
+    # Model configs differ in whether they take token_type_ids; export what the tokenizer emits
+    sample = tokenizer(["example input"], return_tensors="pt")
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    path = os.path.join(model_path, ONNX_FILE)
+    torch.onnx.export(
+        model,
+        (dict(sample),),
+        path,
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=opset,
+    )
+    logger.info(f"Exported {path}")
+    paths = [path]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(model_path, ONNX_INT8_FILE)
+        quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+        logger.info(f"Quantized {quantized_path}")
+        paths.append(quantized_path)
+    return paths
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Build ONNX graphs for the inference backends")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="export MODEL_PATH to ONNX")
+    export.add_argument("model_path")
+    export.add_argument("--quantize", action="store_true", help="also write model.int8.onnx")
+    export.add_argument("--opset", type=int, default=14)
+    args = parser.parse_args()
+    export_onnx(args.model_path, args.quantize, args.opset)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
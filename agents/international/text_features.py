@@ -0,0 +1,85 @@
+"""
+Hashed n-gram text features for Hebrew and English customer messages.
+
+Text is normalized (NFKC, lower case, Hebrew points removed, whitespace
+collapsed), split into word n-grams and character n-grams, and each n-gram is
+hashed into one of `dim` buckets with a signed CRC32. There is no vocabulary
+to build or ship, the result is stable across processes, and misspellings and
+Hebrew prefixes (ו, ה, ב, ל...) still share most of their character n-grams.
+"""
+import re
+import zlib
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+# Hebrew cantillation marks and vowel points (niqqud)
+HEBREW_POINTS = re.compile(r"[\u0591-\u05C7]")
+NON_WORD = re.compile(r"[^\w\s]+")
+WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize(text):
+    """Canonical form used for hashing, caching and keyword matching"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = HEBREW_POINTS.sub("", text)
+    text = NON_WORD.sub(" ", text)
+    return WHITESPACE.sub(" ", text).strip()
+
+
+def ngrams(text, word_ngrams=(1, 2), char_ngrams=(3, 5)):
+    """Word and character n-grams of normalized text, prefixed by kind"""
+    words = text.split()
+    for n in range(word_ngrams[0], word_ngrams[1] + 1):
+        for i in range(len(words) - n + 1):
+            yield "w:" + " ".join(words[i:i + n])
+    for word in words:
+        padded = f" {word} "
+        for n in range(char_ngrams[0], char_ngrams[1] + 1):
+            for i in range(len(padded) - n + 1):
+                yield "c:" + padded[i:i + n]
+
+
+class HashingEmbedder:
+    """Maps texts to L2-normalized, optionally IDF-weighted, hashed n-gram vectors"""
+
+    def __init__(self, dim=1024, word_ngrams=(1, 2), char_ngrams=(3, 5), idf=None):
+        self.dim = dim
+        self.word_ngrams = tuple(word_ngrams)
+        self.char_ngrams = tuple(char_ngrams)
+        self.idf = idf
+
+    def counts(self, text):
+        """Signed bucket counts for one text"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for gram in ngrams(normalize(text), self.word_ngrams, self.char_ngrams):
+            h = zlib.crc32(gram.encode())
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return vector
+
+    def fit_idf(self, texts):
+        """Weight buckets by inverse document frequency over `texts`"""
+        document_frequency = np.zeros(self.dim, dtype=np.float32)
+        for text in texts:
+            document_frequency += self.counts(text) != 0
+        self.idf = np.log((1 + len(texts)) / (1 + document_frequency)).astype(np.float32) + 1
+        return self
+
+    def transform(self, texts):
+        """Matrix of shape (len(texts), dim), one unit-length row per text"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = self.counts(text)
+            # Sublinear term frequency keeps repeated words from dominating
+            vector = np.sign(counts) * np.log1p(np.abs(counts))
+            if self.idf is not None:
+                vector *= self.idf
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                matrix[row] = vector / norm
+        return matrix
+
+    def config(self):
+        return {"dim": self.dim, "word_ngrams": self.word_ngrams, "char_ngrams": self.char_ngrams}
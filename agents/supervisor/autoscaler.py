@@ -0,0 +1,317 @@
+import os
+import math
+import time
+import logging
+import threading
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+
+import requests
+from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Autoscaler")
+
+# RabbitMQ management API (shipped with the rabbitmq:3-management image)
+MANAGEMENT_URL = os.getenv("RABBITMQ_MANAGEMENT_URL", "http://rabbitmq:15672").rstrip("/")
+MANAGEMENT_USER = os.getenv("RABBITMQ_USER", "pelephone")
+MANAGEMENT_PASSWORD = os.getenv("RABBITMQ_PASSWORD", "password")
+VHOST = os.getenv("RABBITMQ_VHOST", "/")
+
+# Services to size, as "service=queue" pairs
+SCALED_SERVICES = os.getenv(
+    "AUTOSCALER_SERVICES",
+    "billing-agent=billing_requests,international-agent=international_requests"
+)
+POLL_INTERVAL = float(os.getenv("AUTOSCALER_POLL_INTERVAL", "10"))
+TARGET_UTILIZATION = float(os.getenv("AUTOSCALER_TARGET_UTILIZATION", "0.75"))
+TARGET_WAIT_SECONDS = float(os.getenv("AUTOSCALER_TARGET_WAIT_SECONDS", "2"))
+BACKLOG_DRAIN_SECONDS = float(os.getenv("AUTOSCALER_BACKLOG_DRAIN_SECONDS", "60"))
+MIN_REPLICAS = int(os.getenv("AUTOSCALER_MIN_REPLICAS", "1"))
+MAX_REPLICAS = int(os.getenv("AUTOSCALER_MAX_REPLICAS", "10"))
+# Request queues split into QUEUE_SHARDS customer shards are sized as one queue
+QUEUE_SHARDS = int(os.getenv("QUEUE_SHARDS", "0"))
+# Weight of the newest service-rate observation in the moving average
+SERVICE_RATE_SMOOTHING = 0.3
+
+
+def parse_services(spec):
+    """Parse "service=queue,service=queue" into a dict"""
+    services = {}
+    for pair in spec.split(","):
+        if "=" in pair:
+            service, queue = pair.split("=", 1)
+            services[service.strip()] = queue.strip()
+    return services
+
+
+def aggregate_shards(shard_stats):
+    """Combine per-shard queue statistics into one queue view.
+
+    Counts and rates add up. Each shard is consumed by a single replica, so
+    the replica count is the number of distinct connections consuming, not
+    the number of consumers.
+    """
+    combined = {"messages_ready": 0, "messages_unacknowledged": 0, "message_stats": {}}
+    publish_rate = ack_rate = 0.0
+    connections = set()
+    for stats in shard_stats:
+        combined["messages_ready"] += stats.get("messages_ready", 0)
+        combined["messages_unacknowledged"] += stats.get("messages_unacknowledged", 0)
+        message_stats = stats.get("message_stats", {})
+        publish_rate += message_stats.get("publish_details", {}).get("rate", 0.0)
+        ack_rate += message_stats.get("ack_details", {}).get("rate", 0.0)
+        for consumer in stats.get("consumer_details", []):
+            connections.add(consumer.get("channel_details", {}).get("connection_name"))
+    combined["message_stats"] = {
+        "publish_details": {"rate": publish_rate},
+        "ack_details": {"rate": ack_rate},
+    }
+    combined["consumers"] = len(connections)
+    combined["max_shard_depth"] = max(
+        (stats.get("messages_ready", 0) for stats in shard_stats), default=0
+    )
+    return combined
+
+
+def erlang_c(servers, offered_load):
+    """Probability that an arriving message has to wait in an M/M/c queue.
+
+    Uses the Erlang B recursion, which stays numerically stable for large
+    server counts where the factorial form overflows.
+    """
+    if offered_load <= 0:
+        return 0.0
+    utilization = offered_load / servers
+    if utilization >= 1:
+        return 1.0
+    erlang_b = 1.0
+    for k in range(1, servers + 1):
+        erlang_b = offered_load * erlang_b / (k + offered_load * erlang_b)
+    return erlang_b / (1 - utilization * (1 - erlang_b))
+
+
+def expected_wait(servers, arrival_rate, service_rate):
+    """Mean time a message waits before a consumer picks it up (M/M/c)"""
+    capacity = servers * service_rate
+    if arrival_rate <= 0:
+        return 0.0
+    if arrival_rate >= capacity:
+        return math.inf
+    return erlang_c(servers, arrival_rate / service_rate) / (capacity - arrival_rate)
+
+
+def recommend_replicas(arrival_rate, service_rate, backlog):
+    """Smallest replica count that meets the utilization, wait and drain targets"""
+    if service_rate <= 0:
+        return None
+    # Replicas needed to burn the current backlog down within the drain window
+    drain_rate = arrival_rate + backlog / BACKLOG_DRAIN_SECONDS
+    replicas = max(MIN_REPLICAS, math.ceil(drain_rate / service_rate))
+    while replicas < MAX_REPLICAS:
+        utilization = arrival_rate / (replicas * service_rate)
+        wait = expected_wait(replicas, arrival_rate, service_rate)
+        if utilization <= TARGET_UTILIZATION and wait <= TARGET_WAIT_SECONDS:
+            break
+        replicas += 1
+    replicas = min(replicas, MAX_REPLICAS)
+    if QUEUE_SHARDS:
+        # Replicas beyond the shard count would own no shard and sit idle
+        replicas = min(replicas, QUEUE_SHARDS)
+    return replicas
+
+
+class QueueMonitor:
+    """
+    Polls the RabbitMQ management API and keeps a scaling signal per service:
+    queue depth, consumer utilization, arrival rate, service rate and the
+    replica count an external autoscaler should converge to.
+    """
+
+    def __init__(self, services):
+        self.services = services
+        self.session = requests.Session()
+        self.session.auth = (MANAGEMENT_USER, MANAGEMENT_PASSWORD)
+        self.signals = {}
+        self.service_rates = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def fetch_queue(self, queue):
+        """Fetch the management API view of a single queue"""
+        url = f"{MANAGEMENT_URL}/api/queues/{quote(VHOST, safe='')}/{quote(queue, safe='')}"
+        response = self.session.get(url, timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_sharded_queue(self, queue):
+        """Fetch every shard of a sharded request queue as one combined view"""
+        return aggregate_shards(
+            [self.fetch_queue(f"{queue}.shard.{shard}") for shard in range(QUEUE_SHARDS)]
+        )
+
+    def estimate_service_rate(self, service, stats, ack_rate, consumers):
+        """Per-replica service rate, learned while the queue is saturated.
+
+        Acks per consumer only measure capacity when consumers are busy, i.e.
+        while messages are waiting; otherwise they just echo the arrival rate.
+        """
+        previous = self.service_rates.get(service)
+        if consumers and ack_rate > 0 and stats.get("messages_ready", 0) > 0:
+            observed = ack_rate / consumers
+            if previous is None:
+                self.service_rates[service] = observed
+            else:
+                self.service_rates[service] = (
+                    SERVICE_RATE_SMOOTHING * observed + (1 - SERVICE_RATE_SMOOTHING) * previous
+                )
+        elif previous is None and consumers and ack_rate > 0:
+            # Not saturated yet: the observed rate is a lower bound, better than nothing
+            return ack_rate / consumers
+        return self.service_rates.get(service)
+
+    def build_signal(self, service, queue, stats):
+        """Turn raw queue statistics into a scaling signal"""
+        message_stats = stats.get("message_stats", {})
+        arrival_rate = message_stats.get("publish_details", {}).get("rate", 0.0)
+        ack_rate = message_stats.get("ack_details", {}).get("rate", 0.0)
+        consumers = stats.get("consumers", 0)
+        backlog = stats.get("messages_ready", 0)
+        service_rate = self.estimate_service_rate(service, stats, ack_rate, consumers)
+
+        if service_rate:
+            recommended = recommend_replicas(arrival_rate, service_rate, backlog)
+            utilization = arrival_rate / (max(consumers, 1) * service_rate)
+            wait = expected_wait(max(consumers, 1), arrival_rate, service_rate)
+        else:
+            # No throughput observed yet, so there is nothing to size against
+            recommended = max(MIN_REPLICAS, min(consumers, MAX_REPLICAS))
+            utilization = None
+            wait = None
+
+        return {
+            "service": service,
+            "queue": queue,
+            "queue_depth": backlog,
+            "unacknowledged": stats.get("messages_unacknowledged", 0),
+            "max_shard_depth": stats.get("max_shard_depth"),
+            "consumers": consumers,
+            "consumer_utilisation": stats.get("consumer_utilisation"),
+            "arrival_rate": arrival_rate,
+            "service_rate": service_rate,
+            "utilization": utilization,
+            "expected_wait_seconds": None if wait is None or math.isinf(wait) else wait,
+            "current_replicas": consumers,
+            "recommended_replicas": recommended,
+            "timestamp": time.time(),
+        }
+
+    def poll(self):
+        """Refresh the scaling signal for every configured service"""
+        for service, queue in self.services.items():
+            try:
+                stats = self.fetch_sharded_queue(queue) if QUEUE_SHARDS else self.fetch_queue(queue)
+            except Exception as e:
+                logger.warning(f"Failed to read queue {queue}: {str(e)}")
+                continue
+            signal = self.build_signal(service, queue, stats)
+            with self._lock:
+                self.signals[service] = signal
+
+    def snapshot(self):
+        """Latest signal per service"""
+        with self._lock:
+            return dict(self.signals)
+
+    def start(self):
+        """Poll in a background thread so HTTP reads never wait on RabbitMQ"""
+        self._thread = threading.Thread(target=self._run, name="queue-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=POLL_INTERVAL)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(POLL_INTERVAL)
+
+
+monitor = QueueMonitor(parse_services(SCALED_SERVICES))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    monitor.start()
+    yield
+    monitor.stop()
+
+
+# Initialize FastAPI app
+app = FastAPI(
+    title="Pelephone Agent Autoscaler",
+    description="Queue-depth based scaling signals for the agent services",
+    version="0.1.0",
+    lifespan=lifespan,
+)
+
+
+@app.get("/scaling")
+async def get_scaling_signals():
+    """Scaling signal for every agent service"""
+    return monitor.snapshot()
+
+
+@app.get("/scaling/{service}")
+async def get_scaling_signal(service: str):
+    """Scaling signal for a single agent service"""
+    signal = monitor.snapshot().get(service)
+    if signal is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No scaling signal for service {service}"
+        )
+    return signal
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Scaling signals in Prometheus text format for metric-based autoscalers"""
+    gauges = [
+        ("queue_depth", "Messages waiting in the request queue"),
+        ("max_shard_depth", "Messages waiting in the deepest shard of a sharded queue"),
+        ("consumers", "Consumers attached to the request queue"),
+        ("arrival_rate", "Messages published per second"),
+        ("service_rate", "Messages handled per second by one replica"),
+        ("utilization", "Offered load divided by current consumer capacity"),
+        ("recommended_replicas", "Replica count suggested by the M/M/c model"),
+    ]
+    signals = monitor.snapshot()
+    lines = []
+    for field, description in gauges:
+        metric = f"agent_{field}"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} gauge")
+        for service, signal in signals.items():
+            value = signal.get(field)
+            if value is not None:
+                lines.append(f'{metric}{{service="{service}",queue="{signal["queue"]}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+# Main entry point
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("AUTOSCALER_PORT", "8100")))
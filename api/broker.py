@@ -0,0 +1,142 @@
+"""
+Pooled RabbitMQ connections for publishing from the API.
+
+Opening an AMQP connection costs several round trips, so request handlers
+borrow a long-lived connection from a small per-process pool instead. pika
+connections are not thread-safe, so each one is lent to one borrower at a
+time. A connection that the broker dropped while it sat idle (missed
+heartbeats) is detected on checkout and replaced.
+
+With `shards` set, request queues are customer-sharded (see sharding.py):
+publishes go to the queue's consistent-hash exchange keyed by customer id,
+and the depth of a queue is the total over its shards.
+"""
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+import pika
+
+from sharding import declare_shards, exchange_name, shard_queues
+
+logger = logging.getLogger("API.Broker")
+
+
+class BrokerUnavailable(Exception):
+    """Raised when no pooled connection frees up in time"""
+
+
+class _PooledChannel:
+    def __init__(self, parameters):
+        self.connection = pika.BlockingConnection(parameters)
+        self.channel = self.connection.channel()
+        self.declared = set()
+
+    def healthy(self):
+        try:
+            # Also services any heartbeats that arrived while idle
+            self.connection.process_data_events(time_limit=0)
+        except pika.exceptions.AMQPError:
+            return False
+        return self.connection.is_open and self.channel.is_open
+
+    def close(self):
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except pika.exceptions.AMQPError:
+            pass
+
+
+class BrokerPool:
+    """Up to `size` connections, each lent to one caller at a time"""
+
+    def __init__(self, url, size=4, heartbeat=60, acquire_timeout=5.0, shards=0,
+                 connect_timeout=10.0, blocked_timeout=5.0):
+        self.parameters = pika.URLParameters(url)
+        self.shards = shards
+        self.parameters.heartbeat = heartbeat
+        # An unreachable broker fails the connect quickly instead of stalling the caller
+        self.parameters.socket_timeout = connect_timeout
+        self.parameters.stack_timeout = connect_timeout * 2
+        # A broker blocking publishers (memory or disk alarm) drops the connection after this
+        self.parameters.blocked_connection_timeout = blocked_timeout
+        self.acquire_timeout = acquire_timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def channel(self):
+        """Borrow a channel; it is discarded instead of returned if the caller fails"""
+        if not self.slots.acquire(timeout=self.acquire_timeout):
+            raise BrokerUnavailable("No broker connection available")
+        entry = None
+        try:
+            while entry is None:
+                try:
+                    entry = self.idle.get_nowait()
+                except queue.Empty:
+                    entry = _PooledChannel(self.parameters)
+                    break
+                if not entry.healthy():
+                    entry.close()
+                    entry = None
+            yield entry
+        except BaseException:
+            if entry is not None:
+                entry.close()
+            raise
+        else:
+            self.idle.put(entry)
+        finally:
+            self.slots.release()
+
+    def _declare(self, entry, queue_name):
+        if queue_name not in entry.declared:
+            if self.shards:
+                declare_shards(entry.channel, queue_name, self.shards)
+            else:
+                entry.channel.queue_declare(queue=queue_name, durable=True)
+            entry.declared.add(queue_name)
+
+    def publish(self, queue_name, body, properties, routing_key=None):
+        """Publish to a durable queue, retrying once on a fresh connection.
+
+        When sharded, `routing_key` picks the shard; messages without one all
+        land on the same shard.
+        """
+        if self.shards:
+            exchange, routing_key = exchange_name(queue_name), routing_key or ''
+        else:
+            exchange, routing_key = '', queue_name
+        for attempt in range(2):
+            try:
+                with self.channel() as entry:
+                    self._declare(entry, queue_name)
+                    entry.channel.basic_publish(
+                        exchange=exchange, routing_key=routing_key, body=body,
+                        properties=properties
+                    )
+                return
+            except pika.exceptions.AMQPError as e:
+                if attempt:
+                    raise
+                logger.warning(f"Publish to {queue_name} failed, reconnecting: {str(e)}")
+
+    def queue_depth(self, queue_name):
+        """Messages waiting in a queue, summed over its shards when sharded"""
+        names = shard_queues(queue_name, self.shards) if self.shards else [queue_name]
+        with self.channel() as entry:
+            return sum(
+                entry.channel.queue_declare(queue=name, durable=True, passive=True)
+                .method.message_count
+                for name in names
+            )
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,50 @@
+"""
+Create an API user, or reset an existing user's password.
+
+    python create_user.py <username> [--email EMAIL] [--full-name NAME] [--password PASSWORD]
+
+The password is prompted for when --password is not given.
+"""
+import sys
+import getpass
+import argparse
+
+from database import SessionLocal, get_engine
+from models import User
+from security import hash_password
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or update an API user")
+    parser.add_argument("username")
+    parser.add_argument("--email")
+    parser.add_argument("--full-name")
+    parser.add_argument("--password", help="read from a prompt when omitted")
+    args = parser.parse_args()
+
+    password = args.password or getpass.getpass(f"Password for {args.username}: ")
+    if not password:
+        print("Password must not be empty")
+        return 1
+
+    get_engine()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == args.username).first()
+        if user is None:
+            user = User(username=args.username, disabled=False)
+            db.add(user)
+        if args.email:
+            user.email = args.email
+        if args.full_name:
+            user.full_name = args.full_name
+        user.hashed_password = hash_password(password)
+        db.commit()
+        print(f"Saved user {args.username}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
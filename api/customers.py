@@ -0,0 +1,237 @@
+import base64
+import logging
+from datetime import datetime
+
+from sqlalchemy import event, select, tuple_
+from sqlalchemy.orm import selectinload
+
+from models import Customer, Request, Response, Bill
+from keyspace import tagged_key
+
+logger = logging.getLogger("API.Customers")
+
+# Cached overview pages live in one hash per customer, so invalidation is one DEL
+OVERVIEW_CACHE_PREFIX = "customer360"
+# Bumped on every invalidation; a page is only cached if no invalidation happened
+# between reading the generation and writing the page
+OVERVIEW_GENERATION_PREFIX = "customer360_gen"
+
+# KEYS: page hash, generation key. ARGV: generation read before the DB load,
+# page key, encoded page, ttl seconds.
+SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+def overview_cache_key(customer_id):
+    # Tagged by customer so it shares a Redis node with the customer's other keys
+    return tagged_key(OVERVIEW_CACHE_PREFIX, customer_id)
+
+
+def overview_generation_key(customer_id):
+    return tagged_key(OVERVIEW_GENERATION_PREFIX, customer_id)
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque keyset cursor pointing just past (created_at, id)"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+def serialize_customer(customer):
+    return {
+        "customer_id": customer.customer_id,
+        "name": customer.name,
+        "email": customer.email,
+        "phone": customer.phone,
+        "plan": customer.plan,
+        "monthly_charge": customer.monthly_charge,
+        "contract_end_date": isoformat(customer.contract_end_date),
+    }
+
+
+def serialize_bill(bill):
+    return {
+        "bill_id": bill.bill_id,
+        "month": bill.month,
+        "year": bill.year,
+        "amount": bill.amount,
+        "status": bill.status,
+        "details": bill.details,
+        "created_at": isoformat(bill.created_at),
+    }
+
+
+def serialize_request(request):
+    return {
+        "request_id": request.request_id,
+        "session_id": request.session_id,
+        "agent_type": request.agent_type,
+        "request_type": request.request_type,
+        "status": request.status,
+        "details": request.details,
+        "created_at": isoformat(request.created_at),
+        "responses": [
+            {
+                "response_id": response.response_id,
+                "agent_type": response.agent_type,
+                "status": response.status,
+                "content": response.content,
+                "created_at": isoformat(response.created_at),
+            }
+            for response in sorted(request.responses, key=lambda r: r.created_at, reverse=True)
+        ],
+    }
+
+
+def keyset_page(db, statement, model, limit, before):
+    """Newest-first page of `statement` strictly older than the `before` cursor.
+
+    Seeks on the (customer_id, created_at, id) index instead of using OFFSET,
+    so deep pages cost the same as the first one.
+    """
+    if before:
+        statement = statement.where(tuple_(model.created_at, model.id) < decode_cursor(before))
+    statement = statement.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+    rows = db.execute(statement).scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def load_customer_overview(db, customer_id, limit, bills_before=None, requests_before=None):
+    """Customer with a page of recent bills and requests (with their responses).
+
+    Four queries regardless of page size: the customer, a bills page, a
+    requests page and one batched IN query for all of the page's responses.
+    """
+    customer = db.execute(
+        select(Customer).where(Customer.customer_id == customer_id)
+    ).scalar_one_or_none()
+    if customer is None:
+        return None
+
+    bills, next_bills = keyset_page(
+        db, select(Bill).where(Bill.customer_id == customer.id), Bill, limit, bills_before
+    )
+    requests, next_requests = keyset_page(
+        db,
+        select(Request)
+        .where(Request.customer_id == customer.id)
+        .options(selectinload(Request.responses)),
+        Request,
+        limit,
+        requests_before,
+    )
+    return {
+        "customer": serialize_customer(customer),
+        "bills": [serialize_bill(bill) for bill in bills],
+        "requests": [serialize_request(request) for request in requests],
+        "next_cursors": {"bills": next_bills, "requests": next_requests},
+    }
+
+
+class CustomerOverviewCache:
+    """
+    Redis cache for customer overview pages, invalidated whenever a bill,
+    request or response for that customer is committed. Each invalidation bumps
+    a per-customer generation, and a page loaded before the bump is not cached.
+    """
+
+    def __init__(self, keyspace, ttl_seconds):
+        self.keyspace = keyspace
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, customer_id, page_key):
+        """(cached page or None, generation to pass to set() after a miss).
+
+        Redis errors propagate so the caller's circuit breaker sees them.
+        """
+        key = overview_cache_key(customer_id)
+        pipe = self.keyspace.client(key).pipeline(transaction=False)
+        pipe.hget(key, page_key)
+        pipe.get(overview_generation_key(customer_id))
+        cached, generation = pipe.execute()
+        return self.keyspace.decode(cached), (generation or b"0").decode()
+
+    def set(self, customer_id, page_key, overview, generation):
+        """Cache a page unless the customer was invalidated since `generation` was read"""
+        key = overview_cache_key(customer_id)
+        script = self.keyspace.client(key).register_script(SET_IF_GENERATION_SCRIPT)
+        script(
+            keys=[key, overview_generation_key(customer_id)],
+            args=[generation, page_key, self.keyspace.encode(overview), self.ttl_seconds]
+        )
+
+    def invalidate(self, customer_ids):
+        if not customer_ids:
+            return
+        try:
+            pipe = self.keyspace.pipeline()
+            for customer_id in customer_ids:
+                generation_key = overview_generation_key(customer_id)
+                pipe.incr(generation_key)
+                # Outlives any page read under the old generation
+                pipe.expire(generation_key, self.ttl_seconds)
+                pipe.delete(overview_cache_key(customer_id))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Customer overview cache invalidation failed: {str(e)}")
+
+    def register(self, session_factory):
+        """Invalidate affected customers after each commit made through `session_factory`"""
+        event.listen(session_factory, "after_flush", self._collect_changes)
+        event.listen(session_factory, "after_commit", self._invalidate_committed)
+        event.listen(session_factory, "after_rollback", self._discard_changes)
+
+    def _collect_changes(self, session, flush_context):
+        customer_pks = set()
+        request_pks = set()
+        # Deleting a bill, request or response changes the overview as much as adding one
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, (Bill, Request)) and obj.customer_id is not None:
+                customer_pks.add(obj.customer_id)
+            elif isinstance(obj, Response) and obj.request_id is not None:
+                request_pks.add(obj.request_id)
+        if not customer_pks and not request_pks:
+            return
+
+        # Resolve to external customer ids on the flush's own connection (no autoflush)
+        connection = session.connection()
+        pending = session.info.setdefault("customer360_invalidate", set())
+        if customer_pks:
+            pending.update(connection.execute(
+                select(Customer.customer_id).where(Customer.id.in_(customer_pks))
+            ).scalars())
+        if request_pks:
+            pending.update(connection.execute(
+                select(Customer.customer_id)
+                .join(Request, Request.customer_id == Customer.id)
+                .where(Request.id.in_(request_pks))
+            ).scalars())
+
+    def _invalidate_committed(self, session):
+        self.invalidate(session.info.pop("customer360_invalidate", None))
+
+    def _discard_changes(self, session):
+        session.info.pop("customer360_invalidate", None)
@@ -0,0 +1,222 @@
+"""
+Streaming bulk export of the requests, responses and bills tables.
+
+Rows are read through a server-side cursor in fixed-size batches and encoded
+batch by batch, so memory stays flat however many rows a date range holds.
+Used by the /exports endpoint and runnable as a CLI:
+
+    python export.py requests --start 2026-01-01 --end 2026-02-01 --format csv --gzip > requests.csv.gz
+    python export.py responses --start 2026-01-01 --end 2026-02-01 --format parquet -o responses.parquet
+"""
+import io
+import os
+import csv
+import sys
+import json
+import zlib
+import argparse
+from datetime import datetime, date
+from decimal import Decimal
+
+from sqlalchemy import Boolean, DateTime, Integer, JSON, select
+
+from database import get_engine
+from models import Request, Response, Bill
+
+# Exportable tables and the timestamp column their date range applies to
+EXPORT_TABLES = {
+    "requests": (Request.__table__, "created_at"),
+    "responses": (Response.__table__, "created_at"),
+    "bills": (Bill.__table__, "created_at"),
+}
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def iter_row_batches(table_name, start, end, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of row dicts from a server-side cursor, `chunk_size` at a time"""
+    table, column = EXPORT_TABLES[table_name]
+    timestamp = table.c[column]
+    statement = (
+        select(table)
+        .where(timestamp >= start, timestamp < end)
+        .order_by(timestamp, table.c.id)
+    )
+    with get_engine().connect() as conn:
+        result = conn.execution_options(yield_per=chunk_size).execute(statement)
+        for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+
+def encode_ndjson(table, batches):
+    for rows in batches:
+        yield "".join(json.dumps(row, default=json_default) + "\n" for row in rows).encode()
+
+
+def encode_csv(table, batches):
+    columns = [column.name for column in table.columns]
+    json_columns = {column.name for column in table.columns if isinstance(column.type, JSON)}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    for rows in batches:
+        for row in rows:
+            writer.writerow([
+                json.dumps(row[name], default=json_default) if name in json_columns
+                else json_default(row[name]) if isinstance(row[name], (datetime, date))
+                else row[name]
+                for name in columns
+            ])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_schema(table):
+    """Arrow schema for a table; JSON columns are exported as JSON strings"""
+    import pyarrow as pa
+
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us", tz="UTC" if column.type.timezone else None)
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def encode_parquet(table, batches):
+    """One Parquet row group per batch, flushed as soon as it is written"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(table)
+    json_columns = {column.name for column in table.columns if isinstance(column.type, JSON)}
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    for rows in batches:
+        columns = {}
+        for field in schema:
+            values = [row[field.name] for row in rows]
+            if field.name in json_columns:
+                values = [None if v is None else json.dumps(v, default=json_default) for v in values]
+            columns[field.name] = values
+        writer.write_table(pa.table(columns, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+    "parquet": encode_parquet,
+}
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def gzip_stream(chunks):
+    """Gzip a byte stream incrementally"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(table_name, start, end, export_format="ndjson", compress=False):
+    """Encoded (and optionally gzipped) export of a table's rows in [start, end)"""
+    table, _ = EXPORT_TABLES[table_name]
+    stream = ENCODERS[export_format](table, iter_row_batches(table_name, start, end))
+    # Parquet compresses its own pages
+    if compress and export_format != "parquet":
+        stream = gzip_stream(stream)
+    return stream
+
+
+def export_filename(table_name, start, end, export_format, compress):
+    extension = "parquet" if export_format == "parquet" else export_format
+    name = f"{table_name}_{start:%Y%m%d}_{end:%Y%m%d}.{extension}"
+    if compress and export_format != "parquet":
+        name += ".gz"
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a table export to a file or stdout")
+    parser.add_argument("table", choices=sorted(EXPORT_TABLES))
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--format", default="ndjson", choices=sorted(EXPORT_FORMATS))
+    parser.add_argument("--gzip", action="store_true", help="gzip ndjson/csv output")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and not parquet_available():
+        print("Parquet export requires pyarrow", file=sys.stderr)
+        return 1
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_stream(args.table, args.start, args.end, args.format, args.gzip):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""
+Sharded, compactly encoded Redis keyspace for sessions and customer caches.
+
+Keys are spread over the nodes in REDIS_SHARD_URLS (falling back to the one
+REDIS_URL node) by a consistent-hash ring, so adding a node only moves about
+1/N of the keys. As in Redis Cluster, a key containing a `{hash tag}` is placed
+by the tag alone: customer:{42}, customer360:{42} and customer_sessions:{42}
+always share a node.
+
+Values are compact UTF-8 JSON. Values of at least REDIS_COMPRESS_MIN_BYTES
+are zlib-compressed and marked with a leading NUL byte, which plain JSON never
+starts with, so values written before compression was enabled still decode.
+
+Counters, locks and anything scripted across several keys (rate limits, shard
+leases) stay on the primary REDIS_URL client and do not go through here.
+
+    python keyspace.py report        # memory per key family and node
+"""
+import os
+import sys
+import json
+import zlib
+import bisect
+import hashlib
+import logging
+import argparse
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import redis
+
+logger = logging.getLogger("Keyspace")
+
+COMPRESSED = b"\x00"
+
+
+def tagged_key(family, tag):
+    """Key placed on the ring by `tag` alone: tagged_key("customer", 42) is customer:{42}"""
+    return f"{family}:{{{tag}}}"
+
+
+def hash_tag(key):
+    """Part of `key` that decides its node: the first non-empty {tag}, else the whole key"""
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def key_family(key):
+    return key.split(":", 1)[0]
+
+
+def node_name(url):
+    """Ring identity of a node: host, port and database, without credentials"""
+    parts = urlsplit(url)
+    return f"{parts.hostname}:{parts.port or 6379}{parts.path or '/0'}"
+
+
+class Codec:
+    """Compact JSON, zlib-compressed above a size threshold (0 disables compression)"""
+
+    def __init__(self, compress_min_bytes=1024, level=6):
+        self.compress_min_bytes = compress_min_bytes
+        self.level = level
+
+    def encode(self, value):
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+        if self.compress_min_bytes and len(data) >= self.compress_min_bytes:
+            return COMPRESSED + zlib.compress(data, self.level)
+        return data
+
+    def decode(self, data):
+        if data is None:
+            return None
+        if data[:1] == COMPRESSED:
+            data = zlib.decompress(data[1:])
+        return json.loads(data)
+
+
+class HashRing:
+    """Consistent-hash ring with `vnodes` points per node"""
+
+    def __init__(self, nodes, vnodes=160):
+        points = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes)
+        )
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def node(self, key):
+        index = bisect.bisect(self.hashes, self._hash(hash_tag(key))) % len(self.hashes)
+        return self.nodes[index]
+
+
+class RoutedPipeline:
+    """
+    Non-transactional pipeline over every node. Each command is sent to the
+    node owning its first argument (the key); execute() returns the results
+    in the order the commands were issued.
+    """
+
+    def __init__(self, keyspace):
+        self.keyspace = keyspace
+        self.pipes = {}
+        self.order = []
+
+    def __getattr__(self, command):
+        def queue_command(key, *args, **kwargs):
+            node = self.keyspace.ring.node(key)
+            pipe = self.pipes.get(node)
+            if pipe is None:
+                pipe = self.pipes[node] = self.keyspace.clients[node].pipeline(transaction=False)
+            getattr(pipe, command)(key, *args, **kwargs)
+            self.order.append(node)
+            return self
+        return queue_command
+
+    def execute(self):
+        results = {node: iter(pipe.execute()) for node, pipe in self.pipes.items()}
+        return [next(results[node]) for node in self.order]
+
+
+class Keyspace:
+    """Redis clients for the ring's nodes plus the value codec"""
+
+    def __init__(self, clients, codec=None, vnodes=160):
+        self.clients = clients
+        self.codec = codec or Codec()
+        self.ring = HashRing(list(clients), vnodes)
+
+    def client(self, key):
+        """Client of the node that owns `key`"""
+        return self.clients[self.ring.node(key)]
+
+    def pipeline(self):
+        return RoutedPipeline(self)
+
+    def encode(self, value):
+        return self.codec.encode(value)
+
+    def decode(self, data):
+        return self.codec.decode(data)
+
+    def get(self, key, ex=None):
+        """Decoded value of `key`, sliding its expiry to `ex` seconds if given"""
+        client = self.client(key)
+        return self.decode(client.getex(key, ex=ex) if ex else client.get(key))
+
+    def set(self, key, value, ex=None):
+        self.client(key).set(key, self.encode(value), ex=ex)
+
+    def mget(self, keys):
+        """Decoded values of `keys` (None where missing), one MGET per node"""
+        by_node = defaultdict(list)
+        for key in keys:
+            by_node[self.ring.node(key)].append(key)
+        found = {}
+        for node, node_keys in by_node.items():
+            found.update(zip(node_keys, self.clients[node].mget(node_keys)))
+        return [self.decode(found[key]) for key in keys]
+
+    def delete(self, *keys):
+        by_node = defaultdict(list)
+        for key in keys:
+            by_node[self.ring.node(key)].append(key)
+        return sum(self.clients[node].delete(*node_keys) for node, node_keys in by_node.items())
+
+    def memory_report(self, match="*", batch=500):
+        """Keys and bytes (MEMORY USAGE) per key family, in total and per node"""
+        report = defaultdict(lambda: {"keys": 0, "bytes": 0, "nodes": defaultdict(int)})
+        for node, client in self.clients.items():
+            keys = []
+            for key in client.scan_iter(match=match, count=batch):
+                keys.append(key)
+                if len(keys) >= batch:
+                    self._measure(node, client, keys, report)
+                    keys = []
+            self._measure(node, client, keys, report)
+        return {
+            family: dict(entry, nodes=dict(entry["nodes"]))
+            for family, entry in sorted(report.items(), key=lambda item: -item[1]["bytes"])
+        }
+
+    @staticmethod
+    def _measure(node, client, keys, report):
+        if not keys:
+            return
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key)
+        for key, size in zip(keys, pipe.execute()):
+            entry = report[key_family(key.decode() if isinstance(key, bytes) else key)]
+            entry["keys"] += 1
+            entry["bytes"] += size or 0
+            entry["nodes"][node] += size or 0
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+
+
+def keyspace_from_env(primary_url, primary_client=None, **client_options):
+    """Keyspace over REDIS_SHARD_URLS, or over the primary node when none are set.
+
+    `client_options` (e.g. socket timeouts) apply to every client created here.
+    """
+    urls = [url.strip() for url in os.getenv("REDIS_SHARD_URLS", "").split(",") if url.strip()]
+    if urls:
+        clients = {node_name(url): redis.from_url(url, **client_options) for url in urls}
+    else:
+        clients = {
+            node_name(primary_url): primary_client or redis.from_url(primary_url, **client_options)
+        }
+    codec = Codec(
+        compress_min_bytes=int(os.getenv("REDIS_COMPRESS_MIN_BYTES", "1024")),
+        level=int(os.getenv("REDIS_COMPRESS_LEVEL", "6")),
+    )
+    return Keyspace(clients, codec, vnodes=int(os.getenv("REDIS_RING_VNODES", "160")))
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Inspect the sharded Redis keyspace")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report = subparsers.add_parser("report", help="memory per key family and node")
+    report.add_argument("--match", default="*", help="only keys matching this pattern")
+    locate = subparsers.add_parser("locate", help="show which node owns a key")
+    locate.add_argument("key")
+    args = parser.parse_args()
+
+    keyspace = keyspace_from_env(os.getenv("REDIS_URL", "redis://:password@redis:6379/0"))
+    if args.command == "report":
+        print(json.dumps(keyspace.memory_report(args.match), indent=2))
+    else:
+        print(keyspace.ring.node(args.key))
+    keyspace.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
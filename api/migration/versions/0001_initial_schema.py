@@ -0,0 +1,144 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('full_name', sa.String(), nullable=True),
+        sa.Column('hashed_password', sa.String(), nullable=True),
+        sa.Column('disabled', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_username', 'users', ['username'], unique=True)
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    op.create_table(
+        'customers',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('customer_id', sa.String(), nullable=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('phone', sa.String(), nullable=True),
+        sa.Column('plan', sa.String(), nullable=True),
+        sa.Column('monthly_charge', sa.Integer(), nullable=True),
+        sa.Column('contract_end_date', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_customers_id', 'customers', ['id'])
+    op.create_index('ix_customers_customer_id', 'customers', ['customer_id'], unique=True)
+    op.create_index('ix_customers_email', 'customers', ['email'])
+
+    op.create_table(
+        'requests',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('request_id', sa.String(), nullable=True),
+        sa.Column('customer_id', sa.Integer(), nullable=True),
+        sa.Column('session_id', sa.String(), nullable=True),
+        sa.Column('agent_type', sa.String(), nullable=True),
+        sa.Column('request_type', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('details', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_requests_id', 'requests', ['id'])
+    op.create_index('ix_requests_request_id', 'requests', ['request_id'], unique=True)
+    op.create_index('ix_requests_session_id', 'requests', ['session_id'])
+
+    op.create_table(
+        'responses',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('response_id', sa.String(), nullable=True),
+        sa.Column('request_id', sa.Integer(), nullable=True),
+        sa.Column('agent_type', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('content', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['request_id'], ['requests.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_responses_id', 'responses', ['id'])
+    op.create_index('ix_responses_response_id', 'responses', ['response_id'], unique=True)
+
+    op.create_table(
+        'bills',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bill_id', sa.String(), nullable=True),
+        sa.Column('customer_id', sa.Integer(), nullable=True),
+        sa.Column('month', sa.String(), nullable=True),
+        sa.Column('year', sa.Integer(), nullable=True),
+        sa.Column('amount', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('details', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_bills_id', 'bills', ['id'])
+    op.create_index('ix_bills_bill_id', 'bills', ['bill_id'], unique=True)
+
+    op.create_table(
+        'sessions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.String(), nullable=True),
+        sa.Column('customer_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('start_time', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('end_time', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('active', sa.Boolean(), nullable=True),
+        sa.Column('agent_assignments', sa.JSON(), nullable=True),
+        sa.Column('session_data', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sessions_id', 'sessions', ['id'])
+    op.create_index('ix_sessions_session_id', 'sessions', ['session_id'], unique=True)
+
+    op.create_table(
+        'logs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('level', sa.String(), nullable=True),
+        sa.Column('source', sa.String(), nullable=True),
+        sa.Column('message', sa.Text(), nullable=True),
+        sa.Column('details', sa.JSON(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_logs_id', 'logs', ['id'])
+
+
+def downgrade():
+    op.drop_table('logs')
+    op.drop_table('sessions')
+    op.drop_table('bills')
+    op.drop_table('responses')
+    op.drop_table('requests')
+    op.drop_table('customers')
+    op.drop_table('users')
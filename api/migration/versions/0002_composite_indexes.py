@@ -0,0 +1,38 @@
+"""composite indexes for common access paths
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # "This customer's requests/bills, newest first", with id as a keyset tiebreaker
+    op.create_index('ix_requests_customer_id_created_at', 'requests', ['customer_id', 'created_at', 'id'])
+    op.create_index('ix_requests_status_created_at', 'requests', ['status', 'created_at'])
+    op.create_index('ix_bills_customer_id_created_at', 'bills', ['customer_id', 'created_at', 'id'])
+    # Responses for a request; also covers the otherwise unindexed foreign key
+    op.create_index('ix_responses_request_id_created_at', 'responses', ['request_id', 'created_at'])
+    op.create_index('ix_sessions_customer_id_start_time', 'sessions', ['customer_id', 'start_time'])
+    # "Errors from the last hour by source"
+    op.create_index('ix_logs_source_level_timestamp', 'logs', ['source', 'level', 'timestamp'])
+    op.create_index('ix_logs_timestamp', 'logs', ['timestamp'])
+
+
+def downgrade():
+    op.drop_index('ix_logs_timestamp', table_name='logs')
+    op.drop_index('ix_logs_source_level_timestamp', table_name='logs')
+    op.drop_index('ix_sessions_customer_id_start_time', table_name='sessions')
+    op.drop_index('ix_responses_request_id_created_at', table_name='responses')
+    op.drop_index('ix_bills_customer_id_created_at', table_name='bills')
+    op.drop_index('ix_requests_status_created_at', table_name='requests')
+    op.drop_index('ix_requests_customer_id_created_at', table_name='requests')
@@ -0,0 +1,136 @@
+"""range-partition responses and logs by month
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 09:20:00.000000
+
+PostgreSQL requires the partition key in every primary key and unique
+constraint, so the primary keys become (id, created_at) / (id, timestamp) and
+response_id is unique per (response_id, created_at). requests stays
+unpartitioned: responses.request_id references requests.id, and a foreign key
+cannot target a partitioned table without the partition key.
+
+Monthly partitions are created from the oldest existing row through three
+months ahead; retention.py keeps creating future months and drops expired ones.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+
+def create_monthly_partitions(table, column, source):
+    """Create a partition per month from the oldest row in `source` through MONTHS_AHEAD"""
+    op.execute(f"""
+        DO $$
+        DECLARE
+            month_start date := date_trunc(
+                'month', coalesce((SELECT min({column}) FROM {source}), now())
+            );
+            last_month date := date_trunc('month', now() + interval '{MONTHS_AHEAD} months');
+        BEGIN
+            WHILE month_start <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                    '{table}_' || to_char(month_start, 'YYYY_MM'),
+                    month_start,
+                    month_start + interval '1 month'
+                );
+                month_start := month_start + interval '1 month';
+            END LOOP;
+        END $$;
+    """)
+
+
+def swap_in_partitioned(table, column, columns_sql, copy_columns):
+    """Replace `table` with a partitioned copy, keeping its id sequence and rows"""
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+    op.execute(f"ALTER INDEX {table}_pkey RENAME TO {table}_unpartitioned_pkey")
+    # Detach the sequence so it survives dropping the old table
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+    op.execute(f"""
+        CREATE TABLE {table} (
+            id INTEGER NOT NULL DEFAULT nextval('{table}_id_seq'),
+            {columns_sql},
+            {column} TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, {column})
+        ) PARTITION BY RANGE ({column})
+    """)
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    create_monthly_partitions(table, column, f"{table}_unpartitioned")
+    op.execute(f"""
+        INSERT INTO {table} (id, {copy_columns}, {column})
+        SELECT id, {copy_columns}, coalesce({column}, now()) FROM {table}_unpartitioned
+    """)
+    op.execute(f"DROP TABLE {table}_unpartitioned")
+
+
+def swap_out_partitioned(table, column, columns_sql, copy_columns):
+    """Inverse of swap_in_partitioned: back to a single plain table"""
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+    op.execute(f"ALTER INDEX {table}_pkey RENAME TO {table}_partitioned_pkey")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+    op.execute(f"""
+        CREATE TABLE {table} (
+            id INTEGER NOT NULL DEFAULT nextval('{table}_id_seq'),
+            {columns_sql},
+            {column} TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (id)
+        )
+    """)
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    op.execute(f"""
+        INSERT INTO {table} (id, {copy_columns}, {column})
+        SELECT id, {copy_columns}, {column} FROM {table}_partitioned
+    """)
+    op.execute(f"DROP TABLE {table}_partitioned")
+
+
+RESPONSES_COLUMNS = """
+            response_id VARCHAR,
+            request_id INTEGER REFERENCES requests (id),
+            agent_type VARCHAR,
+            status VARCHAR,
+            content JSON"""
+RESPONSES_COPY = "response_id, request_id, agent_type, status, content"
+
+LOGS_COLUMNS = """
+            level VARCHAR,
+            source VARCHAR,
+            message TEXT,
+            details JSON"""
+LOGS_COPY = "level, source, message, details"
+
+
+def upgrade():
+    swap_in_partitioned('responses', 'created_at', RESPONSES_COLUMNS, RESPONSES_COPY)
+    op.create_index('ix_responses_id', 'responses', ['id'])
+    op.create_index('ix_responses_response_id', 'responses', ['response_id'])
+    op.create_unique_constraint(
+        'uq_responses_response_id_created_at', 'responses', ['response_id', 'created_at']
+    )
+    op.create_index('ix_responses_request_id_created_at', 'responses', ['request_id', 'created_at'])
+
+    swap_in_partitioned('logs', 'timestamp', LOGS_COLUMNS, LOGS_COPY)
+    op.create_index('ix_logs_id', 'logs', ['id'])
+    op.create_index('ix_logs_source_level_timestamp', 'logs', ['source', 'level', 'timestamp'])
+    op.create_index('ix_logs_timestamp', 'logs', ['timestamp'])
+
+
+def downgrade():
+    swap_out_partitioned('logs', 'timestamp', LOGS_COLUMNS, LOGS_COPY)
+    op.create_index('ix_logs_id', 'logs', ['id'])
+    op.create_index('ix_logs_source_level_timestamp', 'logs', ['source', 'level', 'timestamp'])
+    op.create_index('ix_logs_timestamp', 'logs', ['timestamp'])
+
+    swap_out_partitioned('responses', 'created_at', RESPONSES_COLUMNS, RESPONSES_COPY)
+    op.create_index('ix_responses_id', 'responses', ['id'])
+    op.create_index('ix_responses_response_id', 'responses', ['response_id'], unique=True)
+    op.create_index('ix_responses_request_id_created_at', 'responses', ['request_id', 'created_at'])
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text, JSON
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -36,6 +36,10 @@ class Customer(Base):
 
 class Request(Base):
     __tablename__ = "requests"
+    __table_args__ = (
+        Index("ix_requests_customer_id_created_at", "customer_id", "created_at", "id"),
+        Index("ix_requests_status_created_at", "status", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     request_id = Column(String, unique=True, index=True)
@@ -54,20 +58,29 @@ class Request(Base):
 
 class Response(Base):
     __tablename__ = "responses"
-
-    id = Column(Integer, primary_key=True, index=True)
-    response_id = Column(String, unique=True, index=True)
+    # Range-partitioned by month on created_at (see migration 0003 and retention.py)
+    __table_args__ = (
+        UniqueConstraint("response_id", "created_at", name="uq_responses_response_id_created_at"),
+        Index("ix_responses_request_id_created_at", "request_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    response_id = Column(String, index=True)
     request_id = Column(Integer, ForeignKey("requests.id"))
     agent_type = Column(String)
     status = Column(String)
     content = Column(JSON)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
 
     # Relationships
     request = relationship("Request", back_populates="responses")
 
 class Bill(Base):
     __tablename__ = "bills"
+    __table_args__ = (
+        Index("ix_bills_customer_id_created_at", "customer_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     bill_id = Column(String, unique=True, index=True)
@@ -85,6 +98,9 @@ class Bill(Base):
 
 class UserSession(Base):  # Renamed from Session to UserSession
     __tablename__ = "sessions"
+    __table_args__ = (
+        Index("ix_sessions_customer_id_start_time", "customer_id", "start_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, unique=True, index=True)
@@ -98,9 +114,14 @@ class UserSession(Base):  # Renamed from Session to UserSession
 
 class Log(Base):
     __tablename__ = "logs"
-
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    # Range-partitioned by month on timestamp (see migration 0003 and retention.py)
+    __table_args__ = (
+        Index("ix_logs_source_level_timestamp", "source", "level", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, index=True, server_default=func.now())
     level = Column(String)
     source = Column(String)
     message = Column(Text)
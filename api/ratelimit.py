@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger("API.RateLimit")
+
+# Token buckets checked and charged atomically: either every bucket has a token
+# to spare and all are charged, or none are and the longest wait is returned,
+# followed by each bucket's own wait (0 for buckets that were not short).
+# KEYS: bucket keys. ARGV: now_ms, cost, then a (rate, burst) pair per key.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local retry_after = 0
+local available = {}
+local waits = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[1 + i * 2])
+    local burst = tonumber(ARGV[2 + i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) / 1000 * rate)
+    available[i] = tokens
+    waits[i] = '0'
+    if tokens < cost then
+        local wait = (cost - tokens) / rate
+        waits[i] = tostring(wait)
+        retry_after = math.max(retry_after, wait)
+    end
+end
+if retry_after > 0 then
+    local result = {0, tostring(retry_after)}
+    for i = 1, #KEYS do
+        result[i + 2] = waits[i]
+    end
+    return result
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[1 + i * 2])
+    local burst = tonumber(ARGV[2 + i * 2])
+    redis.call('HSET', key, 'tokens', available[i] - cost, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {1, '0'}
+"""
+
+
+def parse_limit(spec):
+    """Parse a "rate:burst" limit (requests per second, bucket size)"""
+    rate, burst = spec.split(":")
+    return float(rate), float(burst)
+
+
+class RateLimiter:
+    """
+    Redis token-bucket limiter shared by every API worker.
+
+    An exhausted bucket is remembered locally until it refills, so a client
+    hammering the API past its limit is turned away without a Redis round trip.
+    Only the buckets that ran out are remembered: one customer over its limit
+    must not block other customers sharing the same user or request-type bucket.
+    """
+
+    # Cap on locally remembered rejections; the map is cleared when it fills up
+    MAX_LOCAL_ENTRIES = 10000
+
+    def __init__(self, redis_client, prefix="ratelimit", breaker=None):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        # Optional CircuitBreaker shared with other Redis callers
+        self.breaker = breaker
+        self.script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+    def _local_retry_after(self, keys, now):
+        """Seconds until every locally blocked key in the set refills, or 0"""
+        retry_after = 0.0
+        for key in keys:
+            blocked_until = self._blocked_until.get(key)
+            if blocked_until is not None:
+                retry_after = max(retry_after, blocked_until - now)
+        return retry_after
+
+    def check(self, buckets, cost=1):
+        """Take `cost` tokens from every bucket, or none of them.
+
+        `buckets` maps a bucket name (e.g. "user:alice") to a (rate, burst)
+        limit. Returns 0 when the request is allowed, otherwise the number of
+        seconds to wait before retrying.
+        """
+        keys = [f"{self.prefix}:{name}" for name in buckets]
+        now = time.monotonic()
+        retry_after = self._local_retry_after(keys, now)
+        if retry_after > 0:
+            return retry_after
+
+        args = [int(time.time() * 1000), cost]
+        for rate, burst in buckets.values():
+            args.extend([rate, burst])
+        if self.breaker is not None and self.breaker.is_open():
+            # Redis is known to be down: fail open without waiting on a timeout
+            return 0
+        try:
+            if self.breaker is not None:
+                result = self.breaker.call(self.script, keys=keys, args=args)
+            else:
+                result = self.script(keys=keys, args=args)
+        except Exception as e:
+            # Fail open: a Redis hiccup should not take the API down with it
+            logger.warning(f"Rate limiter unavailable, allowing request: {str(e)}")
+            return 0
+        allowed, retry_after, waits = result[0], result[1], result[2:]
+        if int(allowed):
+            return 0
+
+        with self._lock:
+            if len(self._blocked_until) >= self.MAX_LOCAL_ENTRIES:
+                self._blocked_until.clear()
+            for key, wait in zip(keys, waits):
+                wait = float(wait)
+                if wait > 0:
+                    self._blocked_until[key] = now + wait
+        return float(retry_after)
+
+
+class AdmissionController:
+    """
+    Global load shedding: refuses new work for a queue once its depth passes a
+    threshold. Depth is sampled at most once per `refresh_seconds` per queue so
+    the check stays off the broker on the hot path.
+    """
+
+    def __init__(self, queue_depth, max_depth, refresh_seconds=2.0):
+        self.queue_depth = queue_depth
+        self.max_depth = max_depth
+        self.refresh_seconds = refresh_seconds
+        self._depths = {}
+        self._lock = threading.Lock()
+
+    def current_depth(self, queue_name):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._depths.get(queue_name)
+            if cached is not None and now - cached[1] < self.refresh_seconds:
+                return cached[0]
+        try:
+            depth = self.queue_depth(queue_name)
+        except Exception as e:
+            logger.warning(f"Could not read depth of {queue_name}: {str(e)}")
+            depth = cached[0] if cached is not None else 0
+        with self._lock:
+            self._depths[queue_name] = (depth, now)
+        return depth
+
+    def should_shed(self, queue_name):
+        """True when the queue is too deep to accept more requests"""
+        if self.max_depth <= 0:
+            return False
+        return self.current_depth(queue_name) > self.max_depth
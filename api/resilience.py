@@ -0,0 +1,295 @@
+"""
+Fast failure around the API's network dependencies (Redis, RabbitMQ).
+
+Each dependency gets a circuit breaker and a bulkhead:
+
+- The breaker opens after `failure_threshold` consecutive connection or
+  timeout errors. While it is open, calls fail at once with CircuitOpen
+  instead of each one waiting out a timeout. After `reset_timeout` seconds it
+  lets `half_open_calls` probe calls through. A successful probe closes it,
+  and a failed one opens it again.
+- The bulkhead is a small thread pool with a bounded number of waiting
+  callers. Blocking client calls run there, off the event loop, so a hung
+  broker ties up only the broker's threads while session reads on Redis
+  carry on.
+
+Spool is an optional per-worker, append-only file of submits that could not
+be published. Once something is spooled, later submits queue behind it, so
+per-customer order survives the outage. A background thread drains the spool
+when the broker breaker lets calls through again.
+"""
+import os
+import json
+import glob
+import time
+import fcntl
+import asyncio
+import logging
+import threading
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("API.Resilience")
+
+
+class DependencyUnavailable(Exception):
+    """A dependency call was refused without being attempted"""
+
+    def __init__(self, dependency, message, retry_after=1.0):
+        super().__init__(f"{dependency}: {message}")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitOpen(DependencyUnavailable):
+    """Raised while a breaker is open"""
+
+
+class BulkheadFull(DependencyUnavailable):
+    """Raised when too many callers are already waiting on a dependency"""
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probes -> closed"""
+
+    def __init__(self, name, failures=(Exception,), failure_threshold=5, reset_timeout=10.0,
+                 half_open_calls=1):
+        self.name = name
+        self.failures = failures
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Admit a call or raise CircuitOpen"""
+        with self._lock:
+            if self.state == "open":
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpen(self.name, "circuit open", retry_after=remaining)
+                self.state, self.probes = "half_open", 0
+                logger.info(f"Circuit {self.name} half-open, probing")
+            if self.state == "half_open":
+                if self.probes >= self.half_open_calls:
+                    raise CircuitOpen(self.name, "circuit half-open, probe in flight")
+                self.probes += 1
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"Circuit {self.name} closed")
+            self.state, self.consecutive_failures = "closed", 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(
+                        f"Circuit {self.name} open after {self.consecutive_failures} failures"
+                    )
+                self.state, self.opened_at = "open", time.monotonic()
+
+    def release(self):
+        """Free a half-open probe slot without judging the dependency"""
+        with self._lock:
+            if self.state == "half_open" and self.probes > 0:
+                self.probes -= 1
+
+    def is_open(self):
+        with self._lock:
+            return self.state == "open" and time.monotonic() < self.opened_at + self.reset_timeout
+
+    def call(self, func, *args, **kwargs):
+        """Run `func` under the breaker; only `failures` exceptions count against it"""
+        self.allow()
+        try:
+            result = func(*args, **kwargs)
+        except self.failures:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Not the dependency's fault (e.g. an HTTPException), but no proof it is healthy either
+            self.release()
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+class Bulkhead:
+    """Dedicated threads for one dependency, with a cap on callers waiting for them"""
+
+    def __init__(self, name, workers, max_pending):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-io")
+        self.slots = asyncio.Semaphore(max_pending)
+
+    async def run(self, func, *args, **kwargs):
+        if self.slots.locked():
+            raise BulkheadFull(self.name, "too many pending calls")
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+            # Carry the caller's context (e.g. the active trace span) into the thread
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(context.run, func, *args, **kwargs)
+            )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class Dependency:
+    """A breaker and a bulkhead for one backing service"""
+
+    def __init__(self, name, failures, workers=8, max_pending=64, failure_threshold=5,
+                 reset_timeout=10.0):
+        self.name = name
+        self.breaker = CircuitBreaker(name, failures, failure_threshold, reset_timeout)
+        self.bulkhead = Bulkhead(name, workers, max_pending)
+
+    async def call(self, func, *args, **kwargs):
+        """Run a blocking call in the bulkhead, failing fast while the circuit is open"""
+        if self.breaker.is_open():
+            # Refuse before queueing for a thread; allow() in the thread handles half-open
+            self.breaker.allow()
+        return await self.bulkhead.run(self.breaker.call, func, *args, **kwargs)
+
+    def snapshot(self):
+        return self.breaker.snapshot()
+
+    def shutdown(self):
+        self.bulkhead.shutdown()
+
+
+class Spool:
+    """
+    Per-process JSON-lines file of unpublished submits, drained in order.
+
+    Each worker writes its own `<directory>/<pid>-<start ns>.jsonl` and holds
+    an exclusive flock on it from before the file appears under that name.
+    Spool files left behind by dead workers are adopted on start, so nothing
+    is stranded across restarts. Records are flushed to the OS on
+    every append, not fsynced.
+    """
+
+    def __init__(self, directory, publish, breaker, max_records=10000, flush_interval=1.0):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{time.time_ns()}.jsonl")
+        self.publish = publish
+        self.breaker = breaker
+        self.max_records = max_records
+        self.flush_interval = flush_interval
+        self.records = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Lock under a name adopters don't glob, then move it into place, so no
+        # other worker can take this file for an orphan
+        pending_path = self.path + ".tmp"
+        self.file = open(pending_path, "a+")
+        fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(pending_path, self.path)
+        self._adopt_orphans()
+
+    def _adopt_orphans(self):
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.jsonl"))):
+            if path == self.path:
+                continue
+            try:
+                orphan = open(path, "r+")
+            except FileNotFoundError:
+                continue  # adopted by another worker since the glob
+            with orphan:
+                try:
+                    fcntl.flock(orphan, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # a live worker's spool
+                try:
+                    linked = os.path.samestat(os.fstat(orphan.fileno()), os.stat(path))
+                except FileNotFoundError:
+                    linked = False
+                if not linked:
+                    continue  # another worker adopted and removed it while we waited
+                records = [json.loads(line) for line in orphan if line.strip()]
+                for record in records:
+                    self._write(record)
+                os.remove(path)
+            if records:
+                logger.info(f"Adopted {len(records)} spooled submits from {path}")
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.records.append(record)
+
+    def pending(self):
+        with self._lock:
+            return len(self.records)
+
+    def append(self, queue_name, body, headers, routing_key):
+        """Spool one submit; raises DependencyUnavailable when the spool is full"""
+        with self._lock:
+            if len(self.records) >= self.max_records:
+                raise DependencyUnavailable("spool", "broker unavailable and spool full")
+            self._write({
+                "queue": queue_name, "body": body, "headers": headers, "routing_key": routing_key
+            })
+
+    def flush(self):
+        """Publish spooled submits in order until one fails; returns how many went out"""
+        with self._lock:
+            batch = list(self.records)
+        sent = 0
+        for record in batch:
+            try:
+                self.breaker.call(
+                    self.publish, record["queue"], record["body"], record["headers"],
+                    record["routing_key"]
+                )
+            except Exception as e:
+                logger.warning(f"Spool flush stopped after {sent} submits: {str(e)}")
+                break
+            sent += 1
+        if sent:
+            with self._lock:
+                # Appends made during the flush stay queued behind the sent prefix
+                self.records = self.records[sent:]
+                self.file.seek(0)
+                self.file.truncate()
+                for record in self.records:
+                    self.file.write(json.dumps(record) + "\n")
+                self.file.flush()
+            logger.info(f"Flushed {sent} spooled submits, {self.pending()} left")
+        return sent
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="spool-flush", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            if self.pending() and not self.breaker.is_open():
+                self.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.file.close()
+        if not self.records:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
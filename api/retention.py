@@ -0,0 +1,119 @@
+"""
+Partition maintenance for the monthly range-partitioned tables.
+
+Creates partitions ahead of time and drops whole months past the retention
+window, which is instant compared with a DELETE over millions of rows.
+Run it daily, e.g. from cron:
+
+    docker-compose exec api python retention.py
+    docker-compose exec api python retention.py --dry-run
+"""
+import os
+import re
+import sys
+import logging
+import argparse
+from datetime import date
+
+from sqlalchemy import text
+
+from database import get_engine
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Retention")
+
+# Partitioned table -> months of data to keep
+RETENTION_MONTHS = {
+    "responses": int(os.getenv("RETENTION_MONTHS_RESPONSES", "24")),
+    "logs": int(os.getenv("RETENTION_MONTHS_LOGS", "3")),
+}
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+PARTITION_NAME = re.compile(r"^(?P<table>\w+)_(?P<year>\d{4})_(?P<month>\d{2})$")
+
+
+def add_months(month_start, months):
+    """First day of the month `months` away from `month_start`"""
+    index = month_start.year * 12 + month_start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def list_partitions(conn, table):
+    """Map each monthly partition of `table` to the first day of its month"""
+    rows = conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = :table
+    """), {"table": table})
+    partitions = {}
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+        if match and match.group("table") == table:
+            partitions[name] = date(int(match.group("year")), int(match.group("month")), 1)
+    return partitions
+
+
+def ensure_future_partitions(conn, table, today, months_ahead, dry_run=False):
+    """Create partitions from the current month through `months_ahead`"""
+    existing = set(list_partitions(conn, table).values())
+    current = date(today.year, today.month, 1)
+    created = []
+    for offset in range(months_ahead + 1):
+        month_start = add_months(current, offset)
+        if month_start in existing:
+            continue
+        name = f"{table}_{month_start:%Y_%m}"
+        created.append(name)
+        if not dry_run:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month_start}') TO ('{add_months(month_start, 1)}')"
+            ))
+    return created
+
+
+def drop_expired_partitions(conn, table, today, keep_months, dry_run=False):
+    """Drop partitions whose whole month is older than the retention window"""
+    cutoff = add_months(date(today.year, today.month, 1), -keep_months)
+    dropped = []
+    for name, month_start in sorted(list_partitions(conn, table).items(), key=lambda item: item[1]):
+        if month_start >= cutoff:
+            continue
+        dropped.append(name)
+        if not dry_run:
+            # Detach first so the parent is only locked for the catalog update
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+    return dropped
+
+
+def run(today=None, dry_run=False):
+    today = today or date.today()
+    for table, keep_months in RETENTION_MONTHS.items():
+        with get_engine().begin() as conn:
+            created = ensure_future_partitions(conn, table, today, MONTHS_AHEAD, dry_run)
+        with get_engine().begin() as conn:
+            dropped = drop_expired_partitions(conn, table, today, keep_months, dry_run)
+        prefix = "[dry run] " if dry_run else ""
+        for name in created:
+            logger.info(f"{prefix}Created partition {name}")
+        for name in dropped:
+            logger.info(f"{prefix}Dropped partition {name}")
+        logger.info(f"{prefix}{table}: keeping {keep_months} months, {len(dropped)} dropped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain monthly table partitions")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+    run(dry_run=args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
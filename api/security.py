@@ -0,0 +1,80 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+# bcrypt work factor for new and rehashed passwords. Pinning min and max to the
+# same value makes passlib flag every hash with a different cost for rehashing.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt releases the GIL, so a thread pool gives real parallelism without
+# blocking the event loop for the ~250 ms a cost-12 hash takes
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Logins allowed to wait for a hashing thread before new ones are turned away
+MAX_PENDING_LOGINS = int(os.getenv("MAX_PENDING_LOGINS", "64"))
+
+# Per-process hashing pool, created in start_password_hashing()
+password_executor = None
+login_slots = None
+# Verified against when the user does not exist, so unknown usernames take as
+# long to reject as wrong passwords. Hashed on the pool at startup, in the
+# background, so it has the configured BCRYPT_ROUNDS cost without slowing
+# import or readiness.
+dummy_hash_future = None
+
+
+class LoginCapacityExceeded(Exception):
+    """Raised when too many logins are already waiting for a hashing thread"""
+
+
+def start_password_hashing():
+    """Create this worker's hashing threads and login slots (from the app lifespan)"""
+    global password_executor, login_slots, dummy_hash_future
+    password_executor = ThreadPoolExecutor(
+        max_workers=PASSWORD_HASH_WORKERS,
+        thread_name_prefix="password-hash"
+    )
+    # Bound to the running loop on first use, so create it inside that loop
+    login_slots = asyncio.Semaphore(MAX_PENDING_LOGINS)
+    dummy_hash_future = password_executor.submit(
+        pwd_context.hash, "dummy password for unknown users"
+    )
+
+
+def stop_password_hashing():
+    if password_executor is not None:
+        password_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def hash_password(password):
+    return pwd_context.hash(password)
+
+
+async def verify_password(password, hashed_password):
+    """Verify a password on the hashing pool.
+
+    Returns (valid, new_hash); new_hash is set when the stored hash uses an
+    outdated scheme or cost and should be replaced.
+    """
+    if login_slots.locked():
+        raise LoginCapacityExceeded()
+    async with login_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            password_executor, pwd_context.verify_and_update, password, hashed_password
+        )
+
+
+async def verify_dummy_password(password):
+    """Spend as long as verify_password() would, for a user that does not exist"""
+    dummy_hash = await asyncio.wrap_future(dummy_hash_future)
+    await verify_password(password, dummy_hash)
@@ -0,0 +1,282 @@
+"""
+Customer-sharded request queues.
+
+With QUEUE_SHARDS > 0 a request queue such as billing_requests becomes an
+x-consistent-hash exchange (rabbitmq_consistent_hash_exchange plugin) bound to
+QUEUE_SHARDS shard queues, billing_requests.shard.0 ... Publishers use the
+customer_id as routing key, so all requests of one customer land on the same
+shard and are handled in publish order by whichever replica owns that shard.
+
+Replicas agree on ownership without talking to each other. Each one
+heartbeats its id into a Redis sorted set, and every shard goes to the live
+member with the highest rendezvous hash, so a replica joining or leaving only
+moves the shards it gains or loses. A shard changes hands through a Redis
+lease: the old owner cancels its consumer, finishes the messages it already
+received and only then releases the lease, and the new owner subscribes only
+once it holds the lease. Shard queues are also single-active-consumer, so the
+broker never delivers one shard to two consumers even if a lease is lost.
+
+    declare_shards(channel, "billing_requests", 8)
+    channel.basic_publish(exchange=exchange_name("billing_requests"),
+                          routing_key=customer_id, body=body)
+"""
+import os
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("Sharding")
+
+# Keep a lease when the lock is free or already ours, refreshing its expiry
+ACQUIRE_SCRIPT = """
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then return 1 end
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('expire', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+
+
+def shard_count():
+    """Configured number of shards per request queue (0 disables sharding)"""
+    return int(os.getenv("QUEUE_SHARDS", "0"))
+
+
+def exchange_name(queue):
+    return f"{queue}.sharded"
+
+
+def shard_queue(queue, shard):
+    return f"{queue}.shard.{shard}"
+
+
+def shard_queues(queue, shards):
+    return [shard_queue(queue, shard) for shard in range(shards)]
+
+
+def declare_shards(channel, queue, shards):
+    """Declare the consistent-hash exchange and its shard queues (idempotent)"""
+    exchange = exchange_name(queue)
+    channel.exchange_declare(exchange=exchange, exchange_type="x-consistent-hash", durable=True)
+    for name in shard_queues(queue, shards):
+        channel.queue_declare(
+            queue=name, durable=True, arguments={"x-single-active-consumer": True}
+        )
+        # The binding key is the shard's weight on the hash ring; equal weights, equal shares
+        channel.queue_bind(queue=name, exchange=exchange, routing_key="1")
+
+
+def rendezvous_weight(member, shard):
+    digest = hashlib.blake2b(f"{member}/{shard}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def rendezvous_owner(shard, members):
+    """Member that owns `shard`; stable for every shard whose owner is still alive"""
+    if not members:
+        return None
+    return max(members, key=lambda member: rendezvous_weight(member, shard))
+
+
+class ShardMembership:
+    """Redis-backed membership and shard leases for the replicas consuming one queue"""
+
+    def __init__(self, redis_client, queue, shards, member_id=None, lease_seconds=15):
+        self.redis = redis_client
+        self.queue = queue
+        self.shards = shards
+        self.member_id = member_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.members_key = f"shards:{queue}:members"
+        self._acquire = redis_client.register_script(ACQUIRE_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+
+    def lease_key(self, shard):
+        return f"shards:{self.queue}:lease:{shard}"
+
+    def heartbeat(self):
+        """Announce this replica, expire silent ones and return the live members"""
+        now = time.time()
+        pipe = self.redis.pipeline()
+        pipe.zadd(self.members_key, {self.member_id: now})
+        pipe.zremrangebyscore(self.members_key, "-inf", now - self.lease_seconds)
+        pipe.zrange(self.members_key, 0, -1)
+        members = pipe.execute()[-1]
+        return sorted(m.decode() if isinstance(m, bytes) else m for m in members)
+
+    def assignment(self, members):
+        """Shards this replica should own for the given live members"""
+        return {
+            shard for shard in range(self.shards)
+            if rendezvous_owner(shard, members) == self.member_id
+        }
+
+    def acquire(self, shard):
+        """Take or renew the lease on a shard; False while another replica holds it"""
+        return bool(self._acquire(keys=[self.lease_key(shard)],
+                                  args=[self.member_id, self.lease_seconds]))
+
+    def release(self, shard):
+        self._release(keys=[self.lease_key(shard)], args=[self.member_id])
+
+    def leave(self):
+        self.redis.zrem(self.members_key, self.member_id)
+
+
+class ShardedConsumer:
+    """
+    Consumes the shards of one request queue that are assigned to this replica.
+
+    Each owned shard gets its own consumer and a single-thread executor, so
+    messages of a shard are handled strictly one after another while
+    different shards run in parallel, at most `concurrency` at a time. All
+    channel calls happen on the connection thread: rebalance() reschedules
+    itself there with call_later.
+    """
+
+    def __init__(self, connection, channel, queue, shards, on_message, membership=None,
+                 prefetch=2, rebalance_interval=5.0, thread_name_prefix="shard", concurrency=1):
+        self.connection = connection
+        self.channel = channel
+        self.queue = queue
+        self.shards = shards
+        self.on_message = on_message
+        self.membership = membership
+        self.prefetch = prefetch
+        self.rebalance_interval = rebalance_interval
+        self.thread_name_prefix = thread_name_prefix
+        self.consumers = {}
+        self.shard_by_tag = {}
+        self.executors = {}
+        self.draining = set()
+        # Shared by every shard thread, so owning more shards never means more busy cores
+        self.handler_slots = threading.BoundedSemaphore(max(1, concurrency))
+        self._stopped = False
+
+    def start(self):
+        # global=False: the limit applies to each shard consumer on its own
+        self.channel.basic_qos(prefetch_count=self.prefetch)
+        if self.membership is None:
+            # Every replica subscribes everywhere; the broker keeps one of them active per shard
+            logger.warning(f"No shard membership store; consuming all {self.shards} shards")
+            for shard in range(self.shards):
+                self._subscribe(shard)
+            return
+        self.rebalance()
+
+    def executor(self, consumer_tag):
+        """Executor of the shard a delivery came from, limited to `concurrency` busy handlers"""
+        return _LimitedExecutor(self.executors[self.shard_by_tag[consumer_tag]], self.handler_slots)
+
+    def owned(self):
+        return set(self.consumers)
+
+    def rebalance(self):
+        """Release shards that moved away, then pick up newly assigned ones"""
+        if self._stopped:
+            return
+        try:
+            members = self.membership.heartbeat()
+            wanted = self.membership.assignment(members)
+            for shard in self.owned() - wanted:
+                self._release(shard)
+            for shard in sorted(wanted - self.owned() - self.draining):
+                if self.membership.acquire(shard):
+                    self._subscribe(shard)
+            for shard in self.owned() & wanted:
+                if not self.membership.acquire(shard):
+                    # Lease expired and was taken over, e.g. after a long stall
+                    logger.warning(f"Lost the lease on {shard_queue(self.queue, shard)}")
+                    self._release(shard)
+            for shard in self.draining:
+                self.membership.acquire(shard)
+        except Exception as e:
+            # Keep the current shards; single-active-consumer still prevents double delivery
+            logger.error(f"Shard rebalance failed: {str(e)}")
+        self.connection.call_later(self.rebalance_interval, self.rebalance)
+
+    def _subscribe(self, shard):
+        if shard not in self.executors:
+            self.executors[shard] = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"{self.thread_name_prefix}-{shard}"
+            )
+        tag = self.channel.basic_consume(
+            queue=shard_queue(self.queue, shard),
+            on_message_callback=self.on_message,
+            auto_ack=False
+        )
+        self.consumers[shard] = tag
+        self.shard_by_tag[tag] = shard
+        logger.info(f"Consuming {shard_queue(self.queue, shard)}")
+
+    def _release(self, shard):
+        """Stop consuming a shard and hand its lease over once its handlers are done"""
+        tag = self.consumers.pop(shard)
+        # Deliveries not yet dispatched to on_message are requeued, in order
+        self.channel.basic_cancel(tag)
+        self.draining.add(shard)
+        # Queued behind the shard's handlers, and behind the acks they schedule
+        self.executors[shard].submit(
+            self.connection.add_callback_threadsafe,
+            functools.partial(self._released, shard, tag)
+        )
+
+    def _released(self, shard, tag):
+        self.draining.discard(shard)
+        self.shard_by_tag.pop(tag, None)
+        if shard in self.consumers:
+            return
+        self.executors.pop(shard).shutdown(wait=False)
+        if self.membership is not None:
+            try:
+                self.membership.release(shard)
+            except Exception as e:
+                logger.error(f"Failed to release lease on shard {shard}: {str(e)}")
+        logger.info(f"Released {shard_queue(self.queue, shard)}")
+
+    def stop(self):
+        """Cancel every shard consumer, finish in-flight handlers and leave the group"""
+        self._stopped = True
+        for shard, tag in list(self.consumers.items()):
+            try:
+                self.channel.basic_cancel(tag)
+            except Exception as e:
+                logger.error(f"Failed to cancel consumer for shard {shard}: {str(e)}")
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+        if self.connection.is_open:
+            # Flush the acks the handlers queued before the leases go to someone else
+            self.connection.process_data_events(time_limit=0)
+        if self.membership is not None:
+            try:
+                for shard in set(self.consumers) | self.draining:
+                    self.membership.release(shard)
+                self.membership.leave()
+            except Exception as e:
+                logger.error(f"Failed to leave shard group: {str(e)}")
+        self.consumers.clear()
+
+
+class _LimitedExecutor:
+    """Submits to a shard's executor; each task waits for a shared handler slot before running"""
+
+    def __init__(self, executor, slots):
+        self.executor = executor
+        self.slots = slots
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(self._run, fn, *args, **kwargs)
+
+    def _run(self, fn, *args, **kwargs):
+        with self.slots:
+            return fn(*args, **kwargs)
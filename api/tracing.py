@@ -0,0 +1,279 @@
+"""
+W3C trace-context propagation through AMQP message headers.
+
+Every hop carries a `traceparent` header (https://www.w3.org/TR/trace-context/),
+so an API request, its queue wait, the agent handler and the response publish
+all land in one trace. The publisher also stamps `x-enqueued-at-us`, which the
+consumer turns into an explicit "queue wait" span.
+
+The sampling decision is made once, at the root of a trace (TRACE_SAMPLE_RATE),
+and every downstream hop follows the `sampled` flag it receives. Sampled spans
+are exported in Zipkin v2 JSON from a background thread, either to a collector
+(TRACE_COLLECTOR_URL, e.g. Jaeger's Zipkin endpoint) or to a JSON-lines file
+(TRACE_EXPORT_FILE). Unsampled spans still propagate ids but are never exported.
+
+    from tracing import tracer_from_env
+    tracer = tracer_from_env("api")
+    with tracer.span("publish billing_requests", kind="PRODUCER") as span:
+        headers = tracer.inject({}, span)
+"""
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import random
+import threading
+import contextvars
+import urllib.request
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+TRACEPARENT_HEADER = "traceparent"
+ENQUEUED_AT_HEADER = "x-enqueued-at-us"
+
+TRACEPARENT_PATTERN = re.compile(
+    r"^(?P<version>[0-9a-f]{2})-(?P<trace_id>[0-9a-f]{32})-(?P<span_id>[0-9a-f]{16})"
+    r"-(?P<flags>[0-9a-f]{2})"
+)
+
+# Span context received from another process
+SpanContext = namedtuple("SpanContext", ["trace_id", "span_id", "sampled"])
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def random_id(bits):
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+def parse_traceparent(value):
+    """SpanContext from a traceparent header value, or None if it is missing or invalid"""
+    if isinstance(value, bytes):
+        value = value.decode(errors="replace")
+    match = TRACEPARENT_PATTERN.match(value.strip().lower()) if value else None
+    if not match or match.group("version") == "ff":
+        return None
+    trace_id, span_id = match.group("trace_id"), match.group("span_id")
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(match.group("flags"), 16) & 1))
+
+
+class Span:
+    """One timed operation; exported when finished if its trace is sampled"""
+
+    def __init__(self, tracer, name, trace_id, parent_id, sampled, kind=None, start=None,
+                 attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random_id(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.attributes = dict(attributes or {})
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self, end=None, error=None):
+        """End the span; later calls are ignored"""
+        if self.end is not None:
+            return
+        self.end = time.time() if end is None else end
+        if error is not None:
+            self.attributes["error"] = str(error)
+        if self.sampled and self.tracer.exporter is not None:
+            self.tracer.exporter.export(self.to_zipkin())
+
+    def to_zipkin(self):
+        document = {
+            "traceId": self.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": int(self.start * 1_000_000),
+            "duration": max(1, int((self.end - self.start) * 1_000_000)),
+            "localEndpoint": {"serviceName": self.tracer.service},
+            "tags": {key: str(value) for key, value in self.attributes.items()},
+        }
+        if self.parent_id:
+            document["parentId"] = self.parent_id
+        if self.kind:
+            document["kind"] = self.kind
+        return document
+
+
+class Tracer:
+    """Creates spans and moves their context in and out of message headers"""
+
+    def __init__(self, service, sample_rate=1.0, exporter=None):
+        self.service = service
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    def current_span(self):
+        return _current_span.get()
+
+    def extract(self, headers):
+        """Remote SpanContext from AMQP or HTTP headers, if they carry one"""
+        if not headers:
+            return None
+        return parse_traceparent(headers.get(TRACEPARENT_HEADER))
+
+    def inject(self, headers=None, span=None):
+        """Copy of `headers` with the traceparent of `span` (default: the current span)"""
+        headers = dict(headers or {})
+        span = span or self.current_span()
+        if span is not None:
+            headers[TRACEPARENT_HEADER] = span.traceparent
+        return headers
+
+    def start_span(self, name, parent=None, headers=None, kind=None, start=None, attributes=None):
+        """Start a child of `parent`, the context in `headers` or the current span, else a root"""
+        if parent is None:
+            parent = self.extract(headers) or self.current_span()
+        if parent is None:
+            trace_id, parent_id = random_id(128), None
+            sampled = random.random() < self.sample_rate
+        else:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        return Span(self, name, trace_id, parent_id, sampled, kind, start, attributes)
+
+    @contextmanager
+    def activate(self, span):
+        """Make `span` the current span (and parent of new spans) for this context"""
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    @contextmanager
+    def span(self, name, **kwargs):
+        """Start a span, make it current and finish it on exit, recording any exception"""
+        span = self.start_span(name, **kwargs)
+        with self.activate(span):
+            try:
+                yield span
+            except Exception as e:
+                span.finish(error=e)
+                raise
+            finally:
+                span.finish()
+
+    def record_queue_wait(self, parent, headers, received_at):
+        """Add a "queue wait" span from the publisher's enqueue stamp to `received_at`.
+
+        Publisher and consumer clocks may differ, so the wait is only as exact as
+        their clock sync; negative waits are clamped to zero.
+        """
+        enqueued_at_us = (headers or {}).get(ENQUEUED_AT_HEADER)
+        try:
+            enqueued_at = min(int(enqueued_at_us) / 1_000_000, received_at)
+        except (TypeError, ValueError):
+            return None  # missing or malformed; never worth failing the message over
+        wait_ms = round((received_at - enqueued_at) * 1000, 3)
+        parent.set_attribute("messaging.queue_wait_ms", wait_ms)
+        span = self.start_span("queue wait", parent=parent, start=enqueued_at)
+        span.finish(end=received_at)
+        return span
+
+
+def enqueue_headers(tracer, span):
+    """AMQP headers for a message published inside `span`"""
+    return tracer.inject({ENQUEUED_AT_HEADER: int(time.time() * 1_000_000)}, span)
+
+
+class SpanExporter:
+    """
+    Buffers finished spans and writes them in batches from a background thread,
+    to a Zipkin-compatible collector and/or a JSON-lines file. The buffer is
+    bounded: spans beyond `buffer_size` are dropped and counted, never blocking
+    the code being traced.
+    """
+
+    def __init__(self, collector_url=None, path=None, batch_size=200, flush_interval=2.0,
+                 buffer_size=10000, timeout=5.0):
+        self.collector_url = collector_url
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+        self.buffer = deque()
+        self.dropped = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, document):
+        if len(self.buffer) >= self.buffer_size:
+            self.dropped += 1
+            return
+        self.buffer.append(document)
+        if len(self.buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _write(self, batch):
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write("".join(json.dumps(document) + "\n" for document in batch))
+        if self.collector_url:
+            request = urllib.request.Request(
+                self.collector_url,
+                data=json.dumps(batch).encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+
+    def flush(self):
+        """Write everything currently buffered; returns False if a write failed"""
+        while self.buffer:
+            batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Spans are diagnostics: drop the batch rather than pile up behind an outage
+                self.dropped += len(batch)
+                sys.stderr.write(f"Span export failed ({self.dropped} spans dropped): {e}\n")
+                return False
+        return True
+
+    def _run(self):
+        backoff = self.flush_interval
+        while not self._stopping.is_set():
+            self._wakeup.wait(backoff)
+            self._wakeup.clear()
+            if self.flush():
+                backoff = self.flush_interval
+            else:
+                backoff = min(backoff * 2, 60)
+
+    def close(self):
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout=self.timeout)
+        self.flush()
+
+
+def tracer_from_env(service):
+    """Tracer configured from TRACE_SAMPLE_RATE, TRACE_COLLECTOR_URL and TRACE_EXPORT_FILE"""
+    sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+    collector_url = os.getenv("TRACE_COLLECTOR_URL")
+    path = os.getenv("TRACE_EXPORT_FILE")
+    exporter = None
+    if collector_url or path:
+        exporter = SpanExporter(collector_url=collector_url, path=path)
+        atexit.register(exporter.close)
+    return Tracer(service, sample_rate, exporter)
@@ -0,0 +1,200 @@
+"""
+Accuracy and latency comparison of an agent's inference backends.
+
+Runs the same labelled texts through each backend with HANDLER_WORKERS
+concurrent callers (as the agent does) and reports latency, throughput,
+accuracy, agreement with the eager float32 model, load time and resident
+memory. It then recommends the fastest backend whose accuracy stays within
+--max-accuracy-drop points of eager.
+
+The dataset is JSON lines with a "text" and, optionally, a "label" field.
+Without labels, agreement with eager stands in for accuracy.
+
+    python agents/billing/inference.py export /models/billing --quantize
+    python benchmarks/bench_inference.py --agent billing --model-path /models/billing \\
+        --dataset billing_eval.jsonl --workers 4
+"""
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import threading
+
+from benchstats import summarize, format_summary, write_report, find_regressions
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--agent", default="billing", choices=["billing", "international"])
+    parser.add_argument("--model-path", default=os.getenv("MODEL_PATH"))
+    parser.add_argument("--dataset", required=True, help="JSON lines with text and label")
+    parser.add_argument("--backends", help="comma-separated backends (default: all)")
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("HANDLER_WORKERS", "1")),
+        help="concurrent callers, as HANDLER_WORKERS in the agent"
+    )
+    parser.add_argument("--batch-size", type=int, default=1, help="texts per call")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed calls per backend")
+    parser.add_argument(
+        "--max-accuracy-drop", type=float, default=1.0, help="allowed accuracy loss in points"
+    )
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a previous JSON report")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="allowed slowdown in %%")
+    return parser.parse_args()
+
+
+def load_dataset(path):
+    texts, labels = [], []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                texts.append(record["text"])
+                labels.append(record.get("label"))
+    return texts, labels if all(label is not None for label in labels) else None
+
+
+def resident_mb():
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return None
+
+
+def run_backend(backend, texts, workers, batch_size):
+    """Predict every text with `workers` concurrent callers; returns predictions and timings"""
+    batches = [(i, texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+    predictions = [None] * len(texts)
+    latencies = []
+    lock = threading.Lock()
+    position = iter(batches)
+
+    def worker():
+        while True:
+            with lock:
+                item = next(position, None)
+            if item is None:
+                return
+            offset, batch = item
+            started = time.perf_counter()
+            result = backend.predict(batch)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                predictions[offset:offset + len(result)] = [label for label, _ in result]
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return predictions, latencies, time.perf_counter() - start
+
+
+def agreement(predictions, reference):
+    if reference is None:
+        return None
+    return 100 * sum(p == r for p, r in zip(predictions, reference)) / len(reference)
+
+
+def main():
+    args = parse_args()
+    if not args.model_path:
+        print("Set --model-path or MODEL_PATH", file=sys.stderr)
+        return 2
+    sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "agents", args.agent))
+    from inference import BACKENDS, load_backend
+
+    texts, labels = load_dataset(args.dataset)
+    names = args.backends.split(",") if args.backends else list(BACKENDS)
+    # Eager runs first so the others can be compared against it
+    names.sort(key=lambda name: name != "eager")
+
+    report = {}
+    reference = None
+    for name in names:
+        gc.collect()
+        memory_before = resident_mb()
+        started = time.perf_counter()
+        try:
+            backend = load_backend(name, args.model_path, handler_workers=args.workers)
+        except Exception as e:
+            print(f"{name:<28} skipped: {e}")
+            continue
+        load_seconds = time.perf_counter() - started
+        memory_after = resident_mb()
+
+        for i in range(min(args.warmup, len(texts))):
+            backend.predict(texts[i:i + args.batch_size])
+        predictions, latencies, elapsed = run_backend(
+            backend, texts, args.workers, args.batch_size
+        )
+        if name == "eager":
+            reference = predictions
+
+        report[name] = {
+            "latency": summarize(latencies),
+            "throughput": len(texts) / elapsed,
+            "accuracy": agreement(predictions, labels),
+            "agreement_with_eager": agreement(predictions, reference),
+            "threads_per_call": backend.threads,
+            "load_seconds": round(load_seconds, 2),
+            "resident_mb": (
+                round(memory_after - memory_before, 1)
+                if memory_before is not None and memory_after is not None else None
+            ),
+        }
+        del backend
+
+    print(f"texts={len(texts)} workers={args.workers} batch_size={args.batch_size}")
+    for name, result in report.items():
+        print(format_summary(name, result["latency"], result["throughput"]))
+        quality = []
+        if result["accuracy"] is not None:
+            quality.append(f"accuracy={result['accuracy']:.2f}%")
+        if result["agreement_with_eager"] is not None:
+            quality.append(f"agreement={result['agreement_with_eager']:.2f}%")
+        quality.append(f"threads={result['threads_per_call']}")
+        quality.append(f"load={result['load_seconds']}s")
+        if result["resident_mb"] is not None:
+            quality.append(f"rss=+{result['resident_mb']}MB")
+        print(f"{'':<28} {' '.join(quality)}")
+
+    # Accuracy against labels when we have them, otherwise agreement with eager
+    metric = "accuracy" if labels is not None else "agreement_with_eager"
+    floor = None
+    if "eager" in report and report["eager"][metric] is not None:
+        floor = report["eager"][metric] - args.max_accuracy_drop
+    acceptable = [
+        name for name, result in report.items()
+        if floor is None or (result[metric] is not None and result[metric] >= floor)
+    ]
+    if acceptable:
+        best = min(acceptable, key=lambda name: report[name]["latency"]["p95_ms"])
+        print(f"Recommended: INFERENCE_BACKEND={best}")
+
+    if args.output:
+        write_report(report, args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
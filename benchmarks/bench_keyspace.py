@@ -0,0 +1,173 @@
+"""
+Size, speed and balance of the sharded Redis keyspace (api/keyspace.py).
+
+For session-shaped and customer-overview-shaped values it reports the
+encoded size and encode/decode latency of plain json.dumps against the
+keyspace codec at each compression threshold. It also reports how evenly
+the hash ring spreads keys over --nodes nodes, and how many keys move when
+one node is added.
+
+With --redis-urls it also writes the generated values to those nodes
+through the keyspace, measures round-trip latency, and prints the
+memory-per-family report. Only point it at scratch Redis instances: it
+writes under the bench: prefix and deletes those keys afterwards.
+
+    python benchmarks/bench_keyspace.py --values 2000 --thresholds 0,256,1024
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from collections import Counter
+
+from benchstats import summarize, format_summary, write_report, find_regressions
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "api"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--values", type=int, default=2000, help="values per shape")
+    parser.add_argument("--thresholds", default="0,256,1024", help="REDIS_COMPRESS_MIN_BYTES values")
+    parser.add_argument("--level", type=int, default=6, help="zlib level")
+    parser.add_argument("--nodes", type=int, default=3, help="ring size for the balance check")
+    parser.add_argument("--redis-urls", help="comma-separated scratch Redis nodes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a previous JSON report")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="allowed slowdown in %%")
+    return parser.parse_args()
+
+
+def make_session(rng, i):
+    return {
+        "session_id": f"{rng.getrandbits(128):032x}",
+        "customer_id": str(rng.randrange(10**6)),
+        "user_id": f"agent{rng.randrange(500)}",
+        "start_time": "2024-03-01T10:15:00.123456",
+        "active": True,
+        "agent_assignments": [{"agent": "billing", "request_id": f"req-{i}-{n}"} for n in range(3)],
+        "notes": "לקוח מבקש הסבר על חיוב נוסף בחשבונית החודשית",
+    }
+
+
+def make_overview(rng, i):
+    bills = [
+        {"id": n, "period": f"2024-{n % 12 + 1:02d}", "amount": round(rng.uniform(50, 300), 2),
+         "status": rng.choice(["paid", "due", "overdue"])}
+        for n in range(20)
+    ]
+    requests = [
+        {"id": n, "type": rng.choice(["billing_inquiry", "refund_request", "plan_change"]),
+         "status": "completed", "created_at": "2024-03-01T10:15:00",
+         "responses": [{"content": "Your billing inquiry has been processed"}]}
+        for n in range(20)
+    ]
+    return {
+        "customer": {"customer_id": str(i), "name": "ישראל ישראלי", "plan": "Premium 100GB"},
+        "bills": bills,
+        "requests": requests,
+        "next_cursors": {"bills": None, "requests": None},
+    }
+
+
+def time_calls(func, values):
+    latencies, results = [], []
+    for value in values:
+        started = time.perf_counter()
+        results.append(func(value))
+        latencies.append(time.perf_counter() - started)
+    return latencies, results
+
+
+def measure_codec(name, codec, values, report):
+    encode_latencies, encoded = time_calls(codec.encode, values)
+    decode_latencies, _ = time_calls(codec.decode, encoded)
+    size = sum(len(data) for data in encoded)
+    report[f"{name} encode"] = {"latency": summarize(encode_latencies), "bytes": size}
+    report[f"{name} decode"] = {"latency": summarize(decode_latencies)}
+    print(format_summary(f"{name} encode", report[f"{name} encode"]["latency"]))
+    print(format_summary(f"{name} decode", report[f"{name} decode"]["latency"]))
+    print(f"{'':<28} {size / len(values):.0f} bytes/value")
+
+
+def measure_ring(nodes, report):
+    from keyspace import HashRing
+
+    names = [f"redis-{n}:6379/0" for n in range(nodes)]
+    keys = [f"session:{n}" for n in range(100000)]
+    ring, grown = HashRing(names), HashRing(names + [f"redis-{nodes}:6379/0"])
+    counts = Counter(ring.node(key) for key in keys)
+    moved = sum(ring.node(key) != grown.node(key) for key in keys) / len(keys)
+    report["ring"] = {
+        "keys_per_node": dict(counts),
+        "max_over_mean": round(max(counts.values()) / (len(keys) / nodes), 3),
+        "moved_on_add": round(moved, 3),
+    }
+    print(f"ring over {nodes} nodes: max/mean={report['ring']['max_over_mean']} "
+          f"moved on adding one node={moved:.1%} (ideal {1 / (nodes + 1):.1%})")
+
+
+def measure_redis(urls, values, report):
+    import redis
+    from keyspace import Keyspace, Codec, node_name
+
+    keyspace = Keyspace({node_name(url): redis.from_url(url) for url in urls}, Codec())
+    keys = [f"bench:{{{n}}}" for n in range(len(values))]
+    try:
+        set_latencies, _ = time_calls(
+            lambda item: keyspace.set(item[0], item[1], ex=300), list(zip(keys, values))
+        )
+        get_latencies, _ = time_calls(keyspace.get, keys)
+        report["redis set"] = {"latency": summarize(set_latencies)}
+        report["redis get"] = {"latency": summarize(get_latencies)}
+        print(format_summary("redis set", report["redis set"]["latency"]))
+        print(format_summary("redis get", report["redis get"]["latency"]))
+        memory = keyspace.memory_report(match="bench:*")
+        print(json.dumps(memory, indent=2))
+    finally:
+        keyspace.delete(*keys)
+        keyspace.close()
+
+
+def main():
+    args = parse_args()
+    from keyspace import Codec
+
+    rng = random.Random(args.seed)
+    shapes = {
+        "session": [make_session(rng, i) for i in range(args.values)],
+        "overview": [make_overview(rng, i) for i in range(args.values)],
+    }
+    plain = Codec(compress_min_bytes=0)
+    plain.encode = lambda value: json.dumps(value).encode()
+
+    report = {}
+    for shape, values in shapes.items():
+        measure_codec(f"{shape} json", plain, values, report)
+        for threshold in [int(t) for t in args.thresholds.split(",")]:
+            codec = Codec(compress_min_bytes=threshold, level=args.level)
+            measure_codec(f"{shape} min={threshold}", codec, values, report)
+    measure_ring(args.nodes, report)
+    if args.redis_urls:
+        measure_redis(args.redis_urls.split(","), shapes["overview"], report)
+
+    if args.output:
+        write_report(report, args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Login-storm benchmark for /token.
+
+Many clients log in back-to-back while a probe keeps calling GET /. With
+password hashing on the event loop the probe latency climbs to the cost of a
+bcrypt verify; with hashing off-loop it should stay flat while /token
+throughput scales with PASSWORD_HASH_WORKERS.
+
+Create the benchmark user first (from api/):
+
+    python create_user.py bench --password password
+    python benchmarks/bench_login.py --concurrency 32 --duration 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+
+import requests
+
+from benchstats import summarize, format_summary, write_report, find_regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--api-url", default=os.getenv("BENCH_API_URL", "http://localhost:8000"))
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="seconds between probes")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a previous JSON report")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="allowed slowdown in %%")
+    return parser.parse_args()
+
+
+def login_worker(args, deadline, latencies, statuses, lock):
+    """Log in repeatedly until the deadline"""
+    session = requests.Session()
+    form = {"username": args.username, "password": args.password}
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status_code = session.post(f"{args.api_url}/token", data=form, timeout=30).status_code
+        except requests.RequestException:
+            status_code = "error"
+        elapsed = time.perf_counter() - started
+        with lock:
+            statuses[status_code] += 1
+            if status_code == 200:
+                latencies.append(elapsed)
+
+
+def probe_worker(args, deadline, latencies):
+    """Measure how responsive the event loop stays during the storm"""
+    session = requests.Session()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            session.get(f"{args.api_url}/", timeout=30)
+            latencies.append(time.perf_counter() - started)
+        except requests.RequestException:
+            pass
+        time.sleep(args.probe_interval)
+
+
+def main():
+    args = parse_args()
+    args.api_url = args.api_url.rstrip("/")
+
+    login_latencies, probe_latencies = [], []
+    statuses = Counter()
+    lock = threading.Lock()
+    start = time.perf_counter()
+    deadline = start + args.duration
+
+    threads = [
+        threading.Thread(target=login_worker, args=(args, deadline, login_latencies, statuses, lock))
+        for _ in range(args.concurrency)
+    ]
+    threads.append(threading.Thread(target=probe_worker, args=(args, deadline, probe_latencies)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "login": {
+            "latency": summarize(login_latencies),
+            "throughput": len(login_latencies) / elapsed,
+            "statuses": {str(code): count for code, count in statuses.items()},
+        },
+        "probe": {"latency": summarize(probe_latencies)},
+    }
+
+    print(f"concurrency={args.concurrency} duration={args.duration}s")
+    print(format_summary("/token", report["login"]["latency"], report["login"]["throughput"]))
+    print(format_summary("GET / during storm", report["probe"]["latency"]))
+    print(f"{'':<28} statuses={dict(statuses)}")
+
+    if args.output:
+        write_report(report, args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
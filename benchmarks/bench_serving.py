@@ -0,0 +1,186 @@
+"""
+Startup time and multi-core throughput of the API server.
+
+Measures, for each worker count:
+  - cold import time of main.py (nothing may connect at import)
+  - time from launching uvicorn until the first request succeeds
+  - throughput and latency under load from several client processes
+  - how long a graceful shutdown (SIGINT) takes
+
+Run from the repository root with the API's dependencies installed. By default
+it requests GET /, which needs no backing services; use --path and
+--bearer-token to exercise an endpoint that touches Redis or the database.
+
+    python benchmarks/bench_serving.py --workers 1,2,4 --duration 15
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import subprocess
+import multiprocessing
+from collections import Counter
+
+import requests
+
+from benchstats import summarize, format_summary, write_report, find_regressions
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(BENCHMARK_DIR, "..", "api")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--bearer-token", help="Authorization token for --path")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per run")
+    parser.add_argument(
+        "--clients", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+        help="load generator processes"
+    )
+    parser.add_argument("--threads", type=int, default=8, help="threads per client process")
+    parser.add_argument("--import-runs", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a previous JSON report")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="allowed slowdown in %%")
+    return parser.parse_args()
+
+
+def measure_import(runs):
+    """Seconds to import main.py in a fresh interpreter"""
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=API_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def start_server(workers, port):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--no-access-log"],
+        cwd=API_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_until_ready(url, headers, timeout=60.0):
+    """Seconds until `url` first answers 200"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            if requests.get(url, headers=headers, timeout=1).status_code == 200:
+                return time.perf_counter() - started
+        except requests.RequestException:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def client_process(url, headers, threads, deadline):
+    """One load generator process; returns its latencies and status counts"""
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                status_code = session.get(url, headers=headers, timeout=30).status_code
+            except requests.RequestException:
+                status_code = "error"
+            elapsed = time.perf_counter() - started
+            with lock:
+                statuses[status_code] += 1
+                if status_code == 200:
+                    latencies.append(elapsed)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return latencies, dict(statuses)
+
+
+def run_load(url, headers, clients, threads, duration):
+    # Wall-clock deadline so every client process stops together
+    deadline = time.time() + duration
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.starmap(
+            client_process, [(url, headers, threads, deadline) for _ in range(clients)]
+        )
+    latencies, statuses = [], Counter()
+    for client_latencies, client_statuses in results:
+        latencies.extend(client_latencies)
+        statuses.update(client_statuses)
+    return latencies, statuses
+
+
+def stop_server(server, timeout=30.0):
+    """Seconds for a graceful shutdown after SIGINT"""
+    started = time.perf_counter()
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+        return None
+    return time.perf_counter() - started
+
+
+def main():
+    args = parse_args()
+    url = f"http://127.0.0.1:{args.port}{args.path}"
+    headers = {"Authorization": f"Bearer {args.bearer_token}"} if args.bearer_token else {}
+
+    report = {"import": {"latency": summarize(measure_import(args.import_runs))}}
+    print(format_summary("import main", report["import"]["latency"]))
+
+    for workers in [int(w) for w in args.workers.split(",")]:
+        server = start_server(workers, args.port)
+        try:
+            startup = wait_until_ready(url, headers)
+            latencies, statuses = run_load(url, headers, args.clients, args.threads, args.duration)
+        finally:
+            shutdown = stop_server(server)
+        name = f"workers={workers}"
+        report[name] = {
+            "latency": summarize(latencies),
+            "throughput": len(latencies) / args.duration,
+            "startup_seconds": round(startup, 3),
+            "shutdown_seconds": round(shutdown, 3) if shutdown is not None else None,
+            "statuses": {str(code): count for code, count in statuses.items()},
+        }
+        print(format_summary(name, report[name]["latency"], report[name]["throughput"]))
+        print(f"{'':<28} startup={startup:.2f}s "
+              f"shutdown={'killed' if shutdown is None else f'{shutdown:.2f}s'} "
+              f"statuses={dict(statuses)}")
+
+    if args.output:
+        write_report(report, args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Shared helpers for the benchmark scripts: latency summaries, report output
+and regression checks against a saved baseline.
+"""
+import json
+import math
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies):
+    """Count, mean and tail latencies in milliseconds for a list of seconds"""
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0, "mean_ms": None, "p50_ms": None, "p95_ms": None,
+                "p99_ms": None, "max_ms": None}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+def format_summary(name, summary, throughput=None):
+    """One aligned report line for a latency summary"""
+    if not summary["count"]:
+        return f"{name:<28} no samples"
+    line = (
+        f"{name:<28} n={summary['count']:<7} p50={summary['p50_ms']:>9.2f}ms "
+        f"p95={summary['p95_ms']:>9.2f}ms p99={summary['p99_ms']:>9.2f}ms"
+    )
+    if throughput is not None:
+        line += f" {throughput:>9.1f}/s"
+    return line
+
+
+def write_report(report, path):
+    """Save a report so later runs can use it as a baseline"""
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def find_regressions(report, baseline, max_regression_pct):
+    """List metrics that got worse than the baseline by more than the allowed margin.
+
+    Both reports map a scenario name to {"latency": summary, "throughput": float}.
+    Higher latency and lower throughput count as regressions.
+    """
+    regressions = []
+    allowed = 1 + max_regression_pct / 100
+    for name, current in report.items():
+        previous = baseline.get(name)
+        if not isinstance(current, dict) or not isinstance(previous, dict):
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            now = (current.get("latency") or {}).get(metric)
+            then = (previous.get("latency") or {}).get(metric)
+            if now is not None and then and now > then * allowed:
+                regressions.append(f"{name} {metric}: {then:.2f} -> {now:.2f}")
+        now = current.get("throughput")
+        then = previous.get("throughput")
+        if now is not None and then and now * allowed < then:
+            regressions.append(f"{name} throughput: {then:.1f}/s -> {now:.1f}/s")
+    return regressions
@@ -0,0 +1,106 @@
+"""
+Append-only, memory-mapped log of captured queue messages.
+
+Layout: an 8-byte magic, then one record per message:
+
+    crc32     u32   over everything after this field
+    ts_us     u64   publish time, microseconds since the epoch
+    queue     u16   length of the queue name
+    meta      u32   length of the properties (compact JSON)
+    body      u32   length of the message body
+    queue name, properties, body
+
+The writer grows the file in chunks and maps it, so appending a record is a
+memcpy. Unused space at the end of the last chunk is truncated away on
+close(). After a crash it is left as zeros, and readers stop at the first
+record that does not check out.
+"""
+import json
+import mmap
+import zlib
+import struct
+from collections import namedtuple
+
+MAGIC = b"PLTRAF01"
+HEADER = struct.Struct("<IQHII")
+
+Record = namedtuple("Record", ["timestamp", "queue", "properties", "body"])
+
+
+class TrafficLogWriter:
+    """Appends records to a new log file through a growing memory map"""
+
+    def __init__(self, path, chunk_bytes=64 << 20):
+        self.file = open(path, "w+b")
+        self.chunk_bytes = chunk_bytes
+        self.file.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.capacity = 0
+        self.map = None
+        self.records = 0
+        self._grow(chunk_bytes)
+
+    def _grow(self, needed):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+        self.capacity += max(self.chunk_bytes, needed)
+        self.file.truncate(self.capacity)
+        self.map = mmap.mmap(self.file.fileno(), self.capacity)
+
+    def append(self, timestamp, queue, properties, body):
+        queue = queue.encode()
+        meta = json.dumps(properties, separators=(",", ":"), default=str).encode()
+        payload = HEADER.pack(0, int(timestamp * 1_000_000), len(queue), len(meta), len(body))
+        size = len(payload) + len(queue) + len(meta) + len(body)
+        if self.offset + size > self.capacity:
+            self._grow(size)
+        start = self.offset
+        self.map[start:start + len(payload)] = payload
+        position = start + len(payload)
+        for part in (queue, meta, body):
+            self.map[position:position + len(part)] = part
+            position += len(part)
+        # The CRC is written last, so a torn record never validates
+        crc = zlib.crc32(self.map[start + 4:position])
+        struct.pack_into("<I", self.map, start, crc)
+        self.offset = position
+        self.records += 1
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(self.offset)
+        self.file.close()
+
+
+class TrafficLog:
+    """Read-only view of a log; iterating yields Records in capture order"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a traffic log")
+
+    def __iter__(self):
+        offset, end = len(MAGIC), len(self.map)
+        view = memoryview(self.map)
+        while offset + HEADER.size <= end:
+            crc, ts_us, queue_len, meta_len, body_len = HEADER.unpack_from(self.map, offset)
+            start = offset + HEADER.size
+            stop = start + queue_len + meta_len + body_len
+            if stop > end or zlib.crc32(view[offset + 4:stop]) != crc or ts_us == 0:
+                break
+            queue = bytes(view[start:start + queue_len]).decode()
+            meta = json.loads(bytes(view[start + queue_len:start + queue_len + meta_len]))
+            yield Record(ts_us / 1_000_000, queue, meta, bytes(view[stop - body_len:stop]))
+            offset = stop
+        view.release()
+
+    def close(self):
+        self.map.close()
+        self.file.close()